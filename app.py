@@ -11,12 +11,40 @@ Merges a main document with multiple appendices into a single PDF with:
 import io
 import json
 import base64
+import hashlib
+import importlib.util
+import logging
+import math
+import multiprocessing
 import os
-from typing import List, Tuple, Dict, Any, Optional
+import pickle
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import tracemalloc
+import weakref
+from weakref import WeakKeyDictionary
+import zipfile
+from contextlib import ExitStack, contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import accumulate
+from stat import S_ISDIR
+from typing import List, Tuple, Dict, Any, Optional, BinaryIO, Union
 from datetime import datetime
+from functools import lru_cache
 import streamlit as st
 from PIL import Image
 from pypdf import PdfReader, PdfWriter
+from pypdf.errors import PdfReadError
+from pypdf.generic import (
+    ArrayObject, ContentStream, DecodedStreamObject, DictionaryObject, FloatObject,
+    IndirectObject, NameObject, StreamObject
+)
+import reportlab
+from reportlab import rl_config
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import inch, cm
 from reportlab.pdfgen import canvas
@@ -31,10 +59,96 @@ from reportlab.pdfbase.ttfonts import TTFont
 # Try to register Hebrew-supporting fonts
 HEBREW_FONT = "Helvetica"  # Fallback
 HEBREW_FONT_BOLD = "Helvetica-Bold"
+FONTS_REGISTERED = False
+
+
+def font_cache_path(font_path: str) -> str:
+    """Return the disk cache path of a parsed font, keyed on file and reportlab version."""
+    stat = os.stat(font_path)
+    key = f"{os.path.abspath(font_path)}|{stat.st_mtime_ns}|{stat.st_size}|{reportlab.Version}"
+    return os.path.join(FONT_CACHE_DIR, content_hash(key.encode('utf-8')) + '.font')
+
+
+def private_dir(path: str) -> bool:
+    """
+    Create path as a directory only the current user can write, or check
+    that an existing one still is: a real directory (not a symlink), owned
+    by this user and not writable by group or others.
+    """
+    try:
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        info = os.lstat(path)
+    except OSError:
+        return False
+    if not S_ISDIR(info.st_mode):
+        return False
+    if hasattr(os, 'getuid') and (info.st_uid != os.getuid() or info.st_mode & 0o022):
+        return False
+    return True
+
+
+def load_ttfont(name: str, font_path: str) -> TTFont:
+    """
+    Load a TrueType font, reusing the parsed font from the disk cache.
+    Parsing the cmap and metrics tables is nearly all of the setup cost; a
+    cached font only needs unpickling. The per-document subset state and
+    the face's scale function are not picklable, so they are rebuilt fresh.
+    Unpickling runs code, so the cache is only used in a private directory
+    (see private_dir). Falls back to parsing when the cache is disabled (an
+    empty FONT_CACHE_DIR), untrusted or unusable.
+    """
+    if not FONT_CACHE_DIR:
+        return TTFont(name, font_path)
+    if not private_dir(FONT_CACHE_DIR):
+        print(f"Warning: Font cache {FONT_CACHE_DIR} is not private to this user, not using it")
+        return TTFont(name, font_path)
+    cache_path = font_cache_path(font_path)
+    
+    try:
+        with open(cache_path, 'rb') as f:
+            font = pickle.load(f)
+        if not isinstance(font, TTFont):
+            raise TypeError(f"not a TTFont: {type(font).__name__}")
+        units_per_em = font.face.unitsPerEm
+        font.face._pdfScale = ((lambda x: x) if units_per_em == 1000
+                               else (lambda x: x * (1000 / units_per_em)))
+    except FileNotFoundError:
+        font = None
+    except Exception as e:
+        # Stale or damaged entry (e.g. from another reportlab): parse again
+        print(f"Warning: Ignoring unusable cached font {name}: {e}")
+        font = None
+    
+    if font is None:
+        font = TTFont(name, font_path)
+        scale, font.face._pdfScale, font.state = font.face._pdfScale, None, None
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=FONT_CACHE_DIR, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(font, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+        except (OSError, pickle.PickleError) as e:
+            print(f"Warning: Could not cache font {name}: {e}")
+        font.face._pdfScale = scale
+    
+    font.fontName = name
+    font.state = WeakKeyDictionary()
+    return font
+
+
+def register_font(name: str, font_path: str) -> None:
+    """
+    Register a TrueType font with reportlab unless it already is. The
+    registry lives in reportlab, so it outlasts the Streamlit reruns that
+    start this module (and FONTS_REGISTERED) over.
+    """
+    if name not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(load_ttfont(name, font_path))
+
 
 def setup_hebrew_fonts():
     """Register Hebrew-supporting fonts. Uses bundled David font first."""
-    global HEBREW_FONT, HEBREW_FONT_BOLD
+    global HEBREW_FONT, HEBREW_FONT_BOLD, FONTS_REGISTERED
     
     # Get the directory where app.py is located
     app_dir = os.path.dirname(os.path.abspath(__file__))
@@ -48,43 +162,124 @@ def setup_hebrew_fonts():
     try:
         # Priority 1: Bundled David font (best for legal docs)
         if os.path.exists(david_regular):
-            pdfmetrics.registerFont(TTFont('David', david_regular))
+            register_font('David', david_regular)
             HEBREW_FONT = 'David'
         if os.path.exists(david_bold):
-            pdfmetrics.registerFont(TTFont('David-Bold', david_bold))
+            register_font('David-Bold', david_bold)
             HEBREW_FONT_BOLD = 'David-Bold'
         
         # Priority 2: Bundled Noto Sans Hebrew (fallback)
         if HEBREW_FONT == "Helvetica":
             if os.path.exists(noto_regular):
-                pdfmetrics.registerFont(TTFont('NotoHebrew', noto_regular))
+                register_font('NotoHebrew', noto_regular)
                 HEBREW_FONT = 'NotoHebrew'
             if os.path.exists(noto_bold):
-                pdfmetrics.registerFont(TTFont('NotoHebrew-Bold', noto_bold))
+                register_font('NotoHebrew-Bold', noto_bold)
                 HEBREW_FONT_BOLD = 'NotoHebrew-Bold'
         
         # Priority 3: Windows system fonts (for local development without bundled fonts)
         if HEBREW_FONT == "Helvetica":
             if os.path.exists(r"C:\Windows\Fonts\david.ttf"):
-                pdfmetrics.registerFont(TTFont('David', r"C:\Windows\Fonts\david.ttf"))
+                register_font('David', r"C:\Windows\Fonts\david.ttf")
                 HEBREW_FONT = 'David'
             if os.path.exists(r"C:\Windows\Fonts\davidbd.ttf"):
-                pdfmetrics.registerFont(TTFont('David-Bold', r"C:\Windows\Fonts\davidbd.ttf"))
+                register_font('David-Bold', r"C:\Windows\Fonts\davidbd.ttf")
                 HEBREW_FONT_BOLD = 'David-Bold'
             
     except Exception as e:
         print(f"Warning: Could not load Hebrew fonts: {e}")
+    
+    FONTS_REGISTERED = True
+
 
-# Initialize fonts
-setup_hebrew_fonts()
+def ensure_hebrew_fonts():
+    """
+    Register the Hebrew fonts on first use.
+    Every renderer calls this instead of fonts being loaded at import, so
+    processes that never draw text (CLI startup, pool workers, tools that
+    only need the helpers) do not pay for it.
+    """
+    if not FONTS_REGISTERED:
+        setup_hebrew_fonts()
 
 # =============================================================================
 # CONSTANTS AND CONFIGURATION
 # =============================================================================
 
 A4_WIDTH, A4_HEIGHT = A4
+
+# Embed image data as binary streams; ASCII85 adds 25% to every JPEG/PNG
+rl_config.useA85 = 0
 SUPPORTED_EXTENSIONS = ['.pdf', '.jpg', '.jpeg', '.png', '.tiff', '.tif', '.bmp']
 
+# The default temp directories are per user: each must be private to the
+# user running the app (see private_dir), which a shared name cannot be
+USER_ID = str(os.getuid()) if hasattr(os, 'getuid') else 'user'
+
+# Disk cache for normalized uploads, keyed on the SHA-256 of the upload
+CACHE_DIR = os.environ.get(
+    'APPENDIX_MERGER_CACHE_DIR',
+    os.path.join(tempfile.gettempdir(), f"appendix-merger-cache-{USER_ID}")
+)
+CACHE_MAX_BYTES = int(os.environ.get('APPENDIX_MERGER_CACHE_MB', '1024')) * 1024 * 1024
+
+# Parsed fonts are cached as pickles (see load_ttfont); empty disables the cache
+FONT_CACHE_DIR = os.environ.get(
+    'APPENDIX_MERGER_FONT_CACHE_DIR',
+    os.path.join(tempfile.gettempdir(), f"appendix-merger-fonts-{USER_ID}")
+)
+
+# Session documents are spilled to temp files here instead of kept in memory
+BLOB_DIR = os.environ.get(
+    'APPENDIX_MERGER_BLOB_DIR',
+    os.path.join(tempfile.gettempdir(), f"appendix-merger-blobs-{USER_ID}")
+)
+
+# Image uploads: resolution on the page (0 keeps full resolution). Images are
+# only downsampled once they exceed the target by the threshold factor, so
+# near-target JPEGs keep the lossless passthrough.
+IMAGE_TARGET_DPI = int(os.environ.get('APPENDIX_MERGER_IMAGE_DPI', '300'))
+IMAGE_DOWNSAMPLE_THRESHOLD = 1.25
+IMAGE_JPEG_QUALITY = 90
+
+# Opt-in tracemalloc profiling of generation (see profile_memory)
+PROFILE_MEMORY = os.environ.get('APPENDIX_MERGER_PROFILE_MEMORY', '') not in ('', '0')
+PROFILE_TOP_SITES = 10
+
+# Process pool for CPU-bound rendering (covers, marking stamps); 0 sizes it
+# to the machine, 1 renders in-process
+DEFAULT_WORKERS = int(os.environ.get('APPENDIX_MERGER_WORKERS', '0')) or os.cpu_count() or 1
+PARALLEL_MIN_TASKS = 8  # Below this, worker start-up costs more than it saves
+# Workers are started fresh rather than forked: forking the multi-threaded
+# Streamlit server can deadlock, and is deprecated from Python 3.12
+POOL_START_METHOD = ('forkserver' if 'forkserver' in multiprocessing.get_all_start_methods()
+                     else 'spawn')
+
+# Stream compression, per deployment: 'off' spends no CPU on compression,
+# 'fast' Flate-compresses generated and uncompressed input streams at a low
+# level, 'max' at the highest level and, when pikepdf is installed, also
+# packs objects into object streams with a cross-reference stream
+COMPRESSION_MODES = ['off', 'fast', 'max']
+COMPRESSION = os.environ.get('APPENDIX_MERGER_COMPRESSION', 'fast')
+FLATE_LEVELS = {'fast': 1, 'max': 9}
+COMPRESSION_MIN_BYTES = 128  # Smaller streams grow once compressed
+
+# Page numbers: just the digits, bottom-left, size 14
+PAGE_NUMBER_FONT_SIZE = 14
+PAGE_NUMBER_X = 30
+PAGE_NUMBER_Y = 25
+
+# TOC layout: entries start below the title, column headers and separator
+TOC_MARGIN = inch
+TOC_LINE_HEIGHT = 35
+TOC_HEADER_HEIGHT = 20 + 10 + 25
+TOC_BOTTOM_LIMIT = TOC_MARGIN + 50
+TOC_LEADER_PITCH = 6  # Distance between dotted-leader dots
+
+# Glyphs reserved up front in every canvas's font subset (ASCII is always
+# included), so covers, TOC, markings and page numbers embed identical fonts
+FONT_PRIME_CHARS = 'אבגדהוזחטיכךלמםנןסעפףצץקרשת' + '׳״־'
+
 # Hebrew letters for numbering
 HEBREW_LETTERS = ['א', 'ב', 'ג', 'ד', 'ה', 'ו', 'ז', 'ח', 'ט', 'י',
                   'יא', 'יב', 'יג', 'יד', 'טו', 'טז', 'יז', 'יח', 'יט', 'כ',
@@ -117,6 +312,9 @@ UI_TEXT = {
     'numbering': 'סוג מספור נספחים',
     'template': 'תבנית עיצוב',
     'add_marking': 'הוסף סימון נספח בעמוד הראשון',
+    'linearize': 'הפק PDF לצפייה מהירה ברשת',
+    'linearize_help': 'העמודים הראשונים מוצגים עוד לפני שהקובץ כולו הורד (Linearized PDF)',
+    'linearize_unavailable': 'צפייה מהירה ברשת דורשת את pikepdf או qpdf, שאינם מותקנים בשרת',
     'project': 'פרויקט',
     'save_project': 'שמור פרויקט',
     'load_project': 'טען פרויקט',
@@ -134,6 +332,8 @@ UI_TEXT = {
     'download': 'הורדת PDF',
     'generating': 'מייצר PDF...',
     'success': 'ה-PDF נוצר בהצלחה!',
+    'stage_metrics': 'זמני שלבים',
+    'memory_peak': 'שיא זיכרון',
     'error': 'שגיאה:',
     'warning_min_files': 'יש להעלות לפחות 2 קבצים (מסמך ראשי + נספח אחד)',
     'warning_no_appendix': 'נדרש לפחות נספח אחד',
@@ -175,42 +375,462 @@ def reverse_hebrew(text: str) -> str:
         return text[::-1]
 
 
+def prime_font_subsets(c: canvas.Canvas) -> None:
+    """
+    Reserve FONT_PRIME_CHARS in the first subset of each Hebrew font on c.
+    Text drawn from these glyphs then adds nothing to the subset, so the
+    fonts embedded by different canvases come out byte-identical and
+    deduplicate_objects can share one copy across the bundle.
+    """
+    for font_name in (HEBREW_FONT, HEBREW_FONT_BOLD):
+        font = pdfmetrics.getFont(font_name)
+        if isinstance(font, TTFont):
+            font.splitString(FONT_PRIME_CHARS, c._doc)
+
+
+def init_render_worker():
+    """Process pool initializer: register the Hebrew fonts once per worker."""
+    ensure_hebrew_fonts()
+
+
+@st.cache_resource(show_spinner=False)
+def get_render_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Return the shared render pool of `workers` processes, starting it on
+    first use. Covers and marking stamps of every generation run on the same
+    pool, so worker start-up and font registration are paid once.
+    Streamlit runs this script as a fresh module on every rerun, which would
+    reset a module-level registry; st.cache_resource keeps the pool for the
+    life of the server process (and works as a plain memo in the CLI).
+    """
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context(POOL_START_METHOD),
+        initializer=init_render_worker,
+    )
+
+
+def discard_render_pool(workers: int) -> None:
+    """Shut down a broken render pool so the next call starts a fresh one."""
+    pool = get_render_pool(workers)
+    get_render_pool.clear(workers)
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def timed_call(func, *args) -> Tuple[Any, float]:
+    """Call func(*args) in a pool worker and return its result with the CPU seconds it took."""
+    cpu_start = time.process_time()
+    result = func(*args)
+    return result, time.process_time() - cpu_start
+
+
+def run_parallel(func, arg_list: List[tuple], workers: Optional[int] = None) -> list:
+    """
+    Call func(*args) for each tuple in arg_list on the shared render pool and
+    return the results in order. Tasks are sent to workers in
+    order-preserving chunks. Runs serially when there are too few tasks or
+    workers for a pool to pay off, or when worker processes cannot be
+    started. The workers' CPU time is added to the thread's pool_cpu, so
+    measure_stage counts it.
+    """
+    workers = workers or DEFAULT_WORKERS
+    if min(workers, len(arg_list)) <= 1 or len(arg_list) < PARALLEL_MIN_TASKS:
+        return [func(*args) for args in arg_list]
+    
+    # A few chunks per worker balances load without a round trip per task
+    chunksize = max(1, math.ceil(len(arg_list) / (min(workers, len(arg_list)) * 4)))
+    
+    try:
+        timed = list(get_render_pool(workers).map(
+            timed_call, [func] * len(arg_list), *zip(*arg_list), chunksize=chunksize
+        ))
+    except (OSError, BrokenProcessPool) as e:
+        discard_render_pool(workers)
+        print(f"Warning: Process pool unavailable, rendering serially: {e}")
+        return [func(*args) for args in arg_list]
+    pool_cpu.seconds = getattr(pool_cpu, 'seconds', 0.0) + sum(cpu for _, cpu in timed)
+    return [result for result, _ in timed]
+
+
+def run_cached(
+    func,
+    arg_list: List[tuple],
+    workers: Optional[int] = None,
+    cache: Optional[Dict[tuple, Any]] = None
+) -> list:
+    """
+    run_parallel with memoization across calls: results for argument tuples
+    already in cache are reused and only the rest are rendered. The cache is
+    then pruned to this call's arguments, so it holds one bundle's worth.
+    """
+    if cache is None:
+        return run_parallel(func, arg_list, workers)
+    
+    missing = list(dict.fromkeys(args for args in arg_list if args not in cache))
+    cache.update(zip(missing, run_parallel(func, missing, workers)))
+    
+    results = [cache[args] for args in arg_list]
+    for args in set(cache) - set(arg_list):
+        del cache[args]
+    return results
+
+
+# =============================================================================
+# INSTRUMENTATION
+# =============================================================================
+
+logger = logging.getLogger("appendix_merger")
+
+# Report of the thread's active profile_memory block, in .report when profiling
+memory_profile = threading.local()
+# tracemalloc is process-wide, so only one block profiles at a time
+memory_profile_lock = threading.Lock()
+# CPU seconds the thread's run_parallel calls have spent in pool workers, in
+# .seconds; the workers are long-lived, so os.times() never counts them
+pool_cpu = threading.local()
+
+
+def cpu_seconds() -> float:
+    """
+    CPU time of this process, its finished children (the qpdf tool) and the
+    pool workers running this thread's tasks (see run_parallel).
+    """
+    times = os.times()
+    return (times.user + times.system + times.children_user + times.children_system
+            + getattr(pool_cpu, 'seconds', 0.0))
+
+
+@contextmanager
+def measure_stage(metrics: Optional[List[Dict[str, Any]]], name: str):
+    """
+    Time one pipeline stage. Yields the stage record for the body to fill in
+    'pages', 'bytes_in' and 'bytes_out'; on exit the wall and CPU time are
+    added, the record is appended to metrics (when given) and logged as a
+    key=value line on the appendix_merger logger.
+    """
+    record = {'stage': name, 'pages': 0, 'bytes_in': 0, 'bytes_out': 0}
+    profile = getattr(memory_profile, 'report', None)
+    if profile is not None:
+        mem_start, peak = tracemalloc.get_traced_memory()
+        profile['peak'] = max(profile['peak'], peak)
+        tracemalloc.reset_peak()
+    wall_start, cpu_start = time.perf_counter(), cpu_seconds()
+    
+    yield record
+    
+    record['wall_s'] = round(time.perf_counter() - wall_start, 4)
+    record['cpu_s'] = round(cpu_seconds() - cpu_start, 4)
+    if profile is not None:
+        mem_end, record['mem_peak'] = tracemalloc.get_traced_memory()
+        record['mem_delta'] = mem_end - mem_start
+        profile['peak'] = max(profile['peak'], record['mem_peak'])
+        profile['stages'].append(record)
+        # Allocation sites are sampled where the pipeline holds the most
+        if mem_end > profile['held']:
+            profile['held'] = mem_end
+            profile['top_sites'] = top_allocation_sites(profile['top'])
+    if metrics is not None:
+        metrics.append(record)
+    logger.info(" ".join(f"{key}={value}" for key, value in record.items()))
+
+
+def configure_logging() -> None:
+    """
+    Write the appendix_merger log lines to stderr, for the Streamlit server
+    (the CLI configures logging itself). Idempotent across script reruns.
+    """
+    if logger.handlers:
+        return
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    # Already written here, so a root handler does not repeat them
+    logger.propagate = False
+
+
+def top_allocation_sites(limit: int) -> List[Dict[str, Any]]:
+    """Return the source lines holding the most traced memory right now."""
+    snapshot = tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+    ])
+    return [{
+        'site': f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+        'bytes': stat.size,
+        'count': stat.count,
+    } for stat in snapshot.statistics('lineno')[:limit]]
+
+
+@contextmanager
+def profile_memory(top: int = PROFILE_TOP_SITES):
+    """
+    Trace Python allocations with tracemalloc for the duration of the block.
+    
+    Yields a report dict, filled in as stages run: every measure_stage
+    record gains 'mem_delta' (net bytes still allocated when the stage ends)
+    and 'mem_peak' (peak traced bytes during the stage) and is collected in
+    'stages'; 'peak' is the overall peak and 'top_sites' the `top` source
+    lines holding the most memory, sampled at the end of the stage that held
+    the most. Only this process is traced, so profile with workers=1.
+    Tracing slows the pipeline down several times; use it for diagnosis.
+    
+    Tracing is process-wide, so concurrent blocks (e.g. two sessions
+    generating at once) wait for each other rather than share a trace.
+    """
+    report = {'peak': 0, 'stages': [], 'top_sites': [], 'top': top, 'held': -1}
+    with memory_profile_lock:
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        memory_profile.report = report
+        try:
+            yield report
+        finally:
+            memory_profile.report = None
+            report['peak'] = max(report['peak'], tracemalloc.get_traced_memory()[1])
+            del report['top'], report['held']
+            if started:
+                tracemalloc.stop()
+
+
+# =============================================================================
+# UPLOAD CACHE
+# =============================================================================
+
+def content_hash(data: bytes) -> str:
+    """Return the SHA-256 hex digest of data."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def cache_paths(key: str) -> Tuple[str, str]:
+    """Return the (pdf, metadata) file paths for a cache key."""
+    base = os.path.join(CACHE_DIR, key)
+    return base + '.pdf', base + '.json'
+
+
+def cache_get(key: str) -> Optional[Tuple[bytes, int]]:
+    """
+    Return cached (pdf_bytes, page_count) for key, or None on a miss.
+    Entries are only trusted from a private directory (see private_dir):
+    anyone who can write there could swap a document in a bundle.
+    """
+    if CACHE_MAX_BYTES <= 0 or not private_dir(CACHE_DIR):
+        return None
+    pdf_path, meta_path = cache_paths(key)
+    try:
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+        with open(pdf_path, 'rb') as f:
+            pdf_bytes = f.read()
+        # Refresh the access time that LRU eviction goes by
+        os.utime(pdf_path)
+    except (OSError, ValueError):
+        return None
+    return pdf_bytes, meta['pages']
+
+
+def cache_put(key: str, pdf_bytes: bytes, page_count: int) -> None:
+    """Store a normalized upload, then evict old entries over the size limit."""
+    if CACHE_MAX_BYTES <= 0:
+        return
+    if not private_dir(CACHE_DIR):
+        print(f"Warning: Upload cache {CACHE_DIR} is not private to this user, not using it")
+        return
+    pdf_path, meta_path = cache_paths(key)
+    try:
+        # Write to temp names and rename, so readers never see partial entries.
+        # The metadata goes last: an entry only counts once it exists.
+        for path, data in ((pdf_path, pdf_bytes),
+                           (meta_path, json.dumps({'pages': page_count}).encode('utf-8'))):
+            fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        cache_evict()
+    except OSError as e:
+        print(f"Warning: Could not write upload cache: {e}")
+
+
+def cache_evict() -> None:
+    """Delete least recently used entries until the cache fits CACHE_MAX_BYTES."""
+    entries = []
+    for name in os.listdir(CACHE_DIR):
+        if name.endswith('.pdf'):
+            stat = os.stat(os.path.join(CACHE_DIR, name))
+            entries.append((stat.st_mtime, stat.st_size, name[:-len('.pdf')]))
+    
+    total = sum(size for _, size, _ in entries)
+    for _, size, key in sorted(entries):
+        if total <= CACHE_MAX_BYTES:
+            break
+        for path in reversed(cache_paths(key)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        total -= size
+
+
+# =============================================================================
+# DOCUMENT STORE
+# =============================================================================
+
+def remove_quietly(path: str) -> None:
+    """Delete a file, ignoring files that are already gone."""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class BlobHandle:
+    """
+    Handle to a document spilled to a temp file.
+    Session state holds only these handles, so memory per session stays flat
+    regardless of bundle size. Readers open the file lazily, and the file is
+    deleted once the handle is garbage collected.
+    """
+    
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.size = size
+        weakref.finalize(self, remove_quietly, path)
+    
+    def open(self) -> BinaryIO:
+        return open(self.path, 'rb')
+    
+    def read(self) -> bytes:
+        with self.open() as f:
+            return f.read()
+
+
+def make_blob_file(suffix: str = '.pdf') -> Tuple[int, str]:
+    """
+    Create a new temp file in BLOB_DIR and return its (fd, path), as
+    tempfile.mkstemp does. Blobs are reopened by path, so BLOB_DIR must be
+    private (see private_dir); anyone else who can write there could swap
+    the files under a session.
+    """
+    if not private_dir(BLOB_DIR):
+        raise PermissionError(
+            f"Temp directory {BLOB_DIR} is not private to this user; "
+            f"set APPENDIX_MERGER_BLOB_DIR to one that is"
+        )
+    return tempfile.mkstemp(dir=BLOB_DIR, suffix=suffix)
+
+
+def store_blob(data: Union[bytes, BinaryIO]) -> BlobHandle:
+    """
+    Write data (bytes, or a stream copied in chunks) to a new temp file in
+    BLOB_DIR and return its handle.
+    """
+    fd, path = make_blob_file()
+    with os.fdopen(fd, 'wb') as f:
+        if isinstance(data, bytes):
+            f.write(data)
+        else:
+            shutil.copyfileobj(data, f)
+        size = f.tell()
+    return BlobHandle(path, size)
+
+
+# A PDF input: in-memory bytes or a spilled document
+PdfSource = Union[bytes, BlobHandle]
+
+
+def open_pdf_source(source: PdfSource) -> BinaryIO:
+    """Return a readable binary stream for a PDF source."""
+    if isinstance(source, BlobHandle):
+        return source.open()
+    return io.BytesIO(source)
+
+
+def source_size(source: PdfSource) -> int:
+    """Return the size in bytes of a PDF source."""
+    if isinstance(source, BlobHandle):
+        return source.size
+    return len(source)
+
+
 # =============================================================================
 # CORE PDF FUNCTIONS
 # =============================================================================
 
-def load_and_normalize_file(uploaded_file) -> Tuple[bytes, int]:
-    """Convert uploaded file to PDF bytes and return page count."""
-    file_name = uploaded_file.name.lower()
-    file_bytes = uploaded_file.read()
-    uploaded_file.seek(0)
+def load_and_normalize_file(
+    uploaded_file,
+    target_dpi: Optional[int] = IMAGE_TARGET_DPI
+) -> Tuple[bytes, int]:
+    """
+    Convert uploaded file to PDF bytes and return page count.
+    Results are cached on disk by content, so repeat uploads are instant.
+    """
+    with measure_stage(None, 'normalize') as stage:
+        file_name = uploaded_file.name.lower()
+        file_bytes = uploaded_file.read()
+        uploaded_file.seek(0)
+        stage['bytes_in'] = len(file_bytes)
+        
+        is_pdf = file_name.endswith('.pdf')
+        key = content_hash(file_bytes) + ('' if is_pdf else f'-image-{target_dpi or 0}dpi')
+        cached = cache_get(key)
+        if cached is None:
+            if is_pdf:
+                pdf_bytes, page_count = file_bytes, count_pdf_pages(file_bytes)
+            else:
+                pdf_bytes, page_count = image_to_pdf(file_bytes, target_dpi), 1
+            cache_put(key, pdf_bytes, page_count)
+        else:
+            pdf_bytes, page_count = cached
+        
+        stage['pages'] = page_count
+        stage['bytes_out'] = len(pdf_bytes)
     
-    if file_name.endswith('.pdf'):
-        reader = PdfReader(io.BytesIO(file_bytes))
-        page_count = len(reader.pages)
-        return file_bytes, page_count
-    else:
-        pdf_bytes = image_to_pdf(file_bytes)
-        return pdf_bytes, 1
+    return pdf_bytes, page_count
+
+
+def count_pdf_pages(pdf_bytes: bytes) -> int:
+    """
+    Return the page count of a PDF.
+    Reads /Count from the root /Pages node and checks it against the counts
+    of the node's kids (a leaf page counts one), which only needs the
+    trailer, the xref and the top of the page tree. The full tree is only
+    walked when the counts are missing or disagree, e.g. in damaged files.
+    """
+    reader = PdfReader(io.BytesIO(pdf_bytes))
+    try:
+        pages = reader.trailer['/Root']['/Pages']
+        count = pages['/Count']
+        kids = [kid.get_object() for kid in pages['/Kids']]
+        kids_count = sum(kid['/Count'] if '/Kids' in kid else 1 for kid in kids)
+        if isinstance(count, int) and count > 0 and count == kids_count:
+            return int(count)
+    except (KeyError, TypeError, ValueError, PdfReadError):
+        pass
+    return len(reader.pages)
 
 
-def image_to_pdf(image_bytes: bytes) -> bytes:
-    """Convert image bytes to A4 PDF page, centered with aspect ratio preserved."""
+def image_to_pdf(image_bytes: bytes, target_dpi: Optional[int] = IMAGE_TARGET_DPI) -> bytes:
+    """
+    Convert image bytes to A4 PDF page, centered with aspect ratio preserved.
+    Images well above target_dpi at their placed size are downsampled while
+    decoding; None or 0 keeps full resolution. Baseline RGB/grayscale JPEGs
+    that need no downsampling are embedded as-is (DCT passthrough); other
+    images are flattened to RGB and embedded losslessly, except downsampled
+    JPEGs, which are re-encoded as JPEG.
+    """
     img = Image.open(io.BytesIO(image_bytes))
+    source_is_jpeg = img.format == 'JPEG'
     
-    # Convert to RGB if necessary
-    if img.mode in ('RGBA', 'P'):
-        background = Image.new('RGB', img.size, (255, 255, 255))
-        if img.mode == 'P':
-            img = img.convert('RGBA')
-        if img.mode == 'RGBA':
-            background.paste(img, mask=img.split()[-1])
-        else:
-            background.paste(img)
-        img = background
-    elif img.mode != 'RGB':
-        img = img.convert('RGB')
+    jpeg_passthrough = (
+        source_is_jpeg
+        and img.mode in ('RGB', 'L')
+        and not img.info.get('progressive')
+        and not img.info.get('progression')
+    )
+    
+    downsampled = False
     
+    # Layout uses the original pixel size, before any downsampling
     margin = 0.5 * inch
     max_width = A4_WIDTH - (2 * margin)
     max_height = A4_HEIGHT - (2 * margin)
@@ -224,16 +844,74 @@ def image_to_pdf(image_bytes: bytes) -> bytes:
     x_offset = (A4_WIDTH - new_width) / 2
     y_offset = (A4_HEIGHT - new_height) / 2
     
+    if target_dpi:
+        target_size = (
+            max(1, round(new_width / 72 * target_dpi)),
+            max(1, round(new_height / 72 * target_dpi)),
+        )
+        if img_width > target_size[0] * IMAGE_DOWNSAMPLE_THRESHOLD:
+            jpeg_passthrough = False
+            downsampled = True
+            # JPEG only: let the decoder scale by 1/2, 1/4 or 1/8 while decoding
+            img.draft(img.mode, target_size)
+            # reduce() does not support bilevel, palette or 16-bit modes
+            if img.mode == '1':
+                img = img.convert('L')
+            elif img.mode in ('P', 'PA'):
+                img = img.convert('RGBA')
+            elif img.mode.startswith('I;16'):
+                img = img.convert('I')
+            factor = min(img.width // target_size[0], img.height // target_size[1])
+            if factor >= 2:
+                img = img.reduce(factor)
+            if img.width > target_size[0]:
+                img = img.resize(target_size, Image.LANCZOS)
+    
+    # Convert to RGB if necessary
+    if jpeg_passthrough:
+        pass  # Embedded unchanged below
+    elif img.mode in ('RGBA', 'P'):
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        if img.mode == 'RGBA':
+            background.paste(img, mask=img.split()[-1])
+        else:
+            background.paste(img)
+        img = background
+    elif img.mode != 'RGB':
+        img = img.convert('RGB')
+    
     buffer = io.BytesIO()
     c = canvas.Canvas(buffer, pagesize=A4)
     
-    img_buffer = io.BytesIO()
-    img.save(img_buffer, format='PNG')
-    img_buffer.seek(0)
-    
-    from reportlab.lib.utils import ImageReader
-    c.drawImage(ImageReader(img_buffer), x_offset, y_offset, 
-                width=new_width, height=new_height)
+    if jpeg_passthrough or (source_is_jpeg and downsampled):
+        if jpeg_passthrough:
+            jpeg_bytes = image_bytes
+        else:
+            jpeg_buffer = io.BytesIO()
+            img.save(jpeg_buffer, format='JPEG', quality=IMAGE_JPEG_QUALITY)
+            jpeg_bytes = jpeg_buffer.getvalue()
+        
+        # Given a .jpg path, reportlab embeds the file data directly as a
+        # DCTDecode stream. An ImageReader would decode every pixel just to
+        # fingerprint the image.
+        fd, jpeg_path = tempfile.mkstemp(suffix='.jpg')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(jpeg_bytes)
+            c.drawImage(jpeg_path, x_offset, y_offset,
+                        width=new_width, height=new_height)
+        finally:
+            os.remove(jpeg_path)
+    else:
+        img_buffer = io.BytesIO()
+        img.save(img_buffer, format='PNG')
+        img_buffer.seek(0)
+        
+        from reportlab.lib.utils import ImageReader
+        c.drawImage(ImageReader(img_buffer), x_offset, y_offset, 
+                    width=new_width, height=new_height)
     c.save()
     
     buffer.seek(0)
@@ -245,14 +923,17 @@ def make_cover_pdf(
     title: str,
     start_page: int,
     end_page: int,
-    template: str = 'classic'
+    template: str = 'classic',
+    compression: str = COMPRESSION
 ) -> bytes:
     """
     Generate a cover sheet for an appendix.
     Shows: נספח X, document title (subtitle), and page range.
     """
+    ensure_hebrew_fonts()
     buffer = io.BytesIO()
-    c = canvas.Canvas(buffer, pagesize=A4)
+    c = canvas.Canvas(buffer, pagesize=A4, pageCompression=compression != 'off')
+    prime_font_subsets(c)
     
     center_x = A4_WIDTH / 2
     center_y = A4_HEIGHT / 2
@@ -315,20 +996,59 @@ def make_cover_pdf(
     return buffer.read()
 
 
-def make_toc_pdf(entries: List[Dict[str, Any]], template: str = 'classic') -> Tuple[bytes, int]:
+def plan_toc_pages(entry_count: int) -> List[int]:
+    """
+    Compute how many TOC entries land on each page, without drawing anything.
+    Uses the same line height and margin rules as make_toc_pdf, which follows
+    this plan for its page breaks.
+    """
+    def capacity(top: float) -> int:
+        if top < TOC_BOTTOM_LIMIT:
+            return 0
+        return int((top - TOC_BOTTOM_LIMIT) // TOC_LINE_HEIGHT) + 1
+    
+    first_page = capacity(A4_HEIGHT - TOC_MARGIN - TOC_HEADER_HEIGHT)
+    other_pages = capacity(A4_HEIGHT - TOC_MARGIN)
+    
+    pages = [min(entry_count, first_page)]
+    remaining = entry_count - pages[0]
+    while remaining > 0:
+        pages.append(min(remaining, other_pages))
+        remaining -= pages[-1]
+    return pages
+
+
+def bundle_page_count(main_pages: int, appendix_pages: List[int]) -> int:
+    """
+    Page count of the final bundle, from the same plan two_pass_generate
+    follows: main document, TOC, and a cover sheet before each appendix.
+    """
+    toc_pages = len(plan_toc_pages(len(appendix_pages)))
+    return main_pages + toc_pages + sum(pages + 1 for pages in appendix_pages)
+
+
+def make_toc_pdf(
+    entries: List[Dict[str, Any]],
+    template: str = 'classic',
+    compression: str = COMPRESSION
+) -> Tuple[bytes, int]:
     """
     Generate Table of Contents pages in Hebrew.
     Shows title "רשימת נספחים לתביעה" with columns for document name and pages.
     Each entry shows: נספח X - שם המסמך ........... עמודים 5-10
     """
+    ensure_hebrew_fonts()
     buffer = io.BytesIO()
-    c = canvas.Canvas(buffer, pagesize=A4)
+    c = canvas.Canvas(buffer, pagesize=A4, pageCompression=compression != 'off')
+    prime_font_subsets(c)
     
-    margin = inch
+    margin = TOC_MARGIN
     y_position = A4_HEIGHT - margin
-    line_height = 35
+    line_height = TOC_LINE_HEIGHT
     
-    pages = 1
+    plan = plan_toc_pages(len(entries))
+    # Entry indices that start a new page
+    page_breaks = set(accumulate(plan[:-1]))
     
     # Draw TOC title
     c.setFont(HEBREW_FONT_BOLD, 22)
@@ -354,10 +1074,9 @@ def make_toc_pdf(entries: List[Dict[str, Any]], template: str = 'classic') -> Tu
     c.setFont(HEBREW_FONT, 14)
     c.setFillColor(black)
     
-    for entry in entries:
-        if y_position < margin + 50:
+    for i, entry in enumerate(entries):
+        if i in page_breaks:
             c.showPage()
-            pages += 1
             y_position = A4_HEIGHT - margin
             c.setFont(HEBREW_FONT, 14)
             c.setFillColor(black)
@@ -383,141 +1102,130 @@ def make_toc_pdf(entries: List[Dict[str, Any]], template: str = 'classic') -> Tu
         dot_start = margin + range_width + 15
         dot_end = A4_WIDTH - margin - appendix_width - 15
         
-        c.setFillColor(gray)
-        dot_x = dot_start
-        while dot_x < dot_end:
-            c.drawString(dot_x, y_position, ".")
-            dot_x += 6
-        c.setFillColor(black)
+        # One glyph run per entry: character spacing pads each dot's
+        # advance out to the leader pitch
+        dot_count = max(0, math.ceil((dot_end - dot_start) / TOC_LEADER_PITCH))
+        if dot_count:
+            dot_width = c.stringWidth(".", HEBREW_FONT, 14)
+            c.setFillColor(gray)
+            c.drawString(dot_start, y_position, "." * dot_count,
+                         charSpace=TOC_LEADER_PITCH - dot_width)
+            c.setFillColor(black)
         
         y_position -= line_height
     
     c.save()
     buffer.seek(0)
-    return buffer.read(), pages
+    return buffer.read(), len(plan)
+
+
+def make_marking_overlay(
+    appendix_number: str,
+    raw_width: float,
+    raw_height: float,
+    rotation: int = 0,
+    compression: str = COMPRESSION
+) -> bytes:
+    """
+    Generate the appendix marking stamp as a single-page overlay PDF.
+    The overlay has the page's raw mediabox dimensions and places the stamp
+    in the VISUAL top-right corner, taking the page rotation into account.
+    """
+    ensure_hebrew_fonts()
+    overlay_buffer = io.BytesIO()
+    c = canvas.Canvas(overlay_buffer, pagesize=(raw_width, raw_height),
+                      pageCompression=compression != 'off')
+    prime_font_subsets(c)
+    
+    # Box dimensions
+    box_width = 70
+    box_height = 30
+    margin = 15
+    
+    marking_text = reverse_hebrew(f"נספח {appendix_number}")
+    
+    # Calculate position based on rotation
+    # We want the marking in the VISUAL top-right corner
+    # For rotated pages, we need to calculate where that is in raw coordinates
+    c.saveState()
+    if rotation == 90:
+        # 90° CW rotation: visual top-right = raw bottom-right
+        # Swap box dimensions and use rotation
+        c.translate(raw_width - margin, margin)
+        c.rotate(90)
+        box_x, box_y = 0, 0
+    elif rotation == 180:
+        # 180° rotation: visual top-right = raw bottom-left
+        box_x = margin
+        box_y = margin
+    elif rotation == 270:
+        # 270° CW rotation: visual top-right = raw bottom-right
+        # Translate to box center pivot, rotate, then back to origin for drawing
+        c.translate(raw_width - margin - box_width/2, margin + box_height/2)
+        c.rotate(270)
+        c.translate(-box_width/2, -box_height/2)
+        box_x, box_y = 0, 0
+    else:
+        # Normal portrait: visual top-right = raw top-right
+        box_x = raw_width - box_width - margin
+        box_y = raw_height - box_height - margin
+    
+    # Draw the marking box
+    c.setFillColor(HexColor('#F5F5F5'))
+    c.setStrokeColor(black)
+    c.setLineWidth(1)
+    c.roundRect(box_x, box_y, box_width, box_height, 4, fill=True, stroke=True)
+    
+    c.setFillColor(black)
+    c.setFont(HEBREW_FONT_BOLD, 12)
+    c.drawCentredString(box_x + box_width/2, box_y + 10, marking_text)
+    c.restoreState()
+    
+    c.save()
+    overlay_buffer.seek(0)
+    return overlay_buffer.read()
+
+
+def marking_geometry(page) -> Tuple[float, float, int]:
+    """Return the raw mediabox width, height and rotation a stamp is laid out for."""
+    # Get rotation from the page (0, 90, 180, 270)
+    rotation = int(page.get('/Rotate') or 0)
+    return float(page.mediabox.width), float(page.mediabox.height), rotation
+
 
+def mark_first_page(page, overlay_pdf: bytes) -> PdfReader:
+    """
+    Merge a marking overlay from make_marking_overlay onto a page, in place.
+    Returns the overlay's reader, which the caller must keep alive until the
+    page's writer is written: pypdf tracks the objects it has already cloned by
+    the id() of their source reader, so a collected reader whose id is reused
+    by the next overlay would get that overlay merged as the old one.
+    """
+    overlay = PdfReader(io.BytesIO(overlay_pdf))
+    page.merge_page(overlay.pages[0])
+    return overlay
 
-def add_appendix_marking(pdf_bytes: bytes, appendix_number: str) -> bytes:
+
+def add_appendix_marking(
+    pdf_bytes: bytes,
+    appendix_number: str,
+    compression: str = COMPRESSION
+) -> bytes:
     """Add appendix marking stamp on the first page of an appendix document."""
     reader = PdfReader(io.BytesIO(pdf_bytes))
     writer = PdfWriter()
     
     for i, page in enumerate(reader.pages):
+        page = writer.add_page(page)
         if i == 0:  # First page only
-            # Get rotation from the page (0, 90, 180, 270)
-            rotation = int(page.get('/Rotate') or 0)
-            
-            # Get the raw mediabox dimensions
-            raw_width = float(page.mediabox.width)
-            raw_height = float(page.mediabox.height)
-            
-            # Create overlay with the same raw dimensions as the page
-            overlay_buffer = io.BytesIO()
-            c = canvas.Canvas(overlay_buffer, pagesize=(raw_width, raw_height))
-            
-            # Box dimensions
-            box_width = 70
-            box_height = 30
-            margin = 15
-            
-            # Calculate position based on rotation
-            # We want the marking in the VISUAL top-right corner
-            # For rotated pages, we need to calculate where that is in raw coordinates
-            if rotation == 0:
-                # Normal portrait: visual top-right = raw top-right
-                box_x = raw_width - box_width - margin
-                box_y = raw_height - box_height - margin
-            elif rotation == 90:
-                # 90° CW rotation: visual top-right = raw bottom-right
-                # Draw rotated box
-                box_x = raw_width - box_height - margin
-                box_y = margin
-                # Swap box dimensions and use rotation
-                c.saveState()
-                c.translate(box_x + box_height, box_y)
-                c.rotate(90)
-                # Now draw in rotated space
-                c.setFillColor(HexColor('#F5F5F5'))
-                c.setStrokeColor(black)
-                c.setLineWidth(1)
-                c.roundRect(0, 0, box_width, box_height, 4, fill=True, stroke=True)
-                marking_text = reverse_hebrew(f"נספח {appendix_number}")
-                c.setFillColor(black)
-                c.setFont(HEBREW_FONT_BOLD, 12)
-                c.drawCentredString(box_width/2, 10, marking_text)
-                c.restoreState()
-                c.save()
-                overlay_buffer.seek(0)
-                overlay_reader = PdfReader(overlay_buffer)
-                page.merge_page(overlay_reader.pages[0])
-                writer.add_page(page)
-                continue
-            elif rotation == 180:
-                # 180° rotation: visual top-right = raw bottom-left
-                box_x = margin
-                box_y = margin
-            elif rotation == 270:
-                # 270° CW rotation: visual top-right = raw bottom-right
-                # Box center pivot point
-                pivot_x = raw_width - margin - box_width/2
-                pivot_y = margin + box_height/2
-                
-                c.saveState()
-                # Translate to pivot, rotate, then translate back to origin for drawing
-                c.translate(pivot_x, pivot_y)
-                c.rotate(270)
-                c.translate(-box_width/2, -box_height/2)
-                
-                # Draw box and text
-                c.setFillColor(HexColor('#F5F5F5'))
-                c.setStrokeColor(black)
-                c.setLineWidth(1)
-                c.roundRect(0, 0, box_width, box_height, 4, fill=True, stroke=True)
-                marking_text = reverse_hebrew(f"נספח {appendix_number}")
-                c.setFillColor(black)
-                c.setFont(HEBREW_FONT_BOLD, 12)
-                c.drawCentredString(box_width/2, 10, marking_text)
-                
-                c.restoreState()
-                
-                c.save()
-                overlay_buffer.seek(0)
-                overlay_reader = PdfReader(overlay_buffer)
-                page.merge_page(overlay_reader.pages[0])
-                writer.add_page(page)
-                continue
-            else:
-                box_x = raw_width - box_width - margin
-                box_y = raw_height - box_height - margin
-            
-            # Draw the marking box (for 0° and 180°)
-            c.setFillColor(HexColor('#F5F5F5'))
-            c.setStrokeColor(black)
-            c.setLineWidth(1)
-            c.roundRect(box_x, box_y, box_width, box_height, 4, fill=True, stroke=True)
-            
-            # Reverse Hebrew for RTL
-            marking_text = reverse_hebrew(f"נספח {appendix_number}")
-            
-            c.setFillColor(black)
-            c.setFont(HEBREW_FONT_BOLD, 12)
-            c.drawCentredString(box_x + box_width/2, box_y + 10, marking_text)
-            
-            c.save()
-            overlay_buffer.seek(0)
-            
-            overlay_reader = PdfReader(overlay_buffer)
-            page.merge_page(overlay_reader.pages[0])
-        
-        writer.add_page(page)
+            overlay = mark_first_page(page, make_marking_overlay(
+                appendix_number, *marking_geometry(page), compression
+            ))
     
-    output = io.BytesIO()
-    writer.write(output)
-    output.seek(0)
-    return output.read()
+    return write_pdf(writer, compression)
 
 
-def merge_pdfs(pdf_list: List[bytes]) -> bytes:
+def merge_pdfs(pdf_list: List[bytes], compression: str = COMPRESSION) -> bytes:
     """Merge multiple PDF byte objects into a single PDF."""
     writer = PdfWriter()
     
@@ -526,87 +1234,567 @@ def merge_pdfs(pdf_list: List[bytes]) -> bytes:
         for page in reader.pages:
             writer.add_page(page)
     
-    output = io.BytesIO()
-    writer.write(output)
-    output.seek(0)
-    return output.read()
+    deduplicate_objects(writer)
+    return write_pdf(writer, compression)
+
+
+@lru_cache(maxsize=None)
+def make_digit_stamps_pdf(font_name: str) -> bytes:
+    """Render the digits 0-9 at the origin, one page per digit."""
+    buffer = io.BytesIO()
+    size = PAGE_NUMBER_FONT_SIZE
+    c = canvas.Canvas(buffer, pagesize=(size, size))
+    prime_font_subsets(c)
+    
+    for digit in '0123456789':
+        c.setFont(font_name, size)
+        c.drawString(0, 0, digit)
+        c.showPage()
+    
+    c.save()
+    buffer.seek(0)
+    return buffer.read()
 
 
-def add_page_numbers(pdf_bytes: bytes) -> bytes:
+class PageNumberStamper:
+    """
+    Stamps page numbers onto the pages of a PdfWriter.
+    The digit glyphs are rendered once and added to the writer as shared form
+    XObjects, so each page only gets a short content stream placing them
+    instead of its own overlay canvas. The stamp is anchored at the bottom-left
+    of the page, so the same forms serve every page size.
+    """
+    
+    NAME_PREFIX = '/AMPageNum'
+    
+    def __init__(self, writer: PdfWriter):
+        ensure_hebrew_fonts()
+        self.writer = writer
+        self.digit_widths = {}
+        self.digit_forms = {}
+        
+        size = PAGE_NUMBER_FONT_SIZE
+        reader = PdfReader(io.BytesIO(make_digit_stamps_pdf(HEBREW_FONT)))
+        for digit, page in zip('0123456789', reader.pages):
+            form = DecodedStreamObject()
+            form.set_data(page.get_contents().get_data())
+            form.update({
+                NameObject('/Type'): NameObject('/XObject'),
+                NameObject('/Subtype'): NameObject('/Form'),
+                NameObject('/BBox'): ArrayObject(
+                    [FloatObject(v) for v in (-size, -size, 2 * size, 2 * size)]
+                ),
+                # Cloning through the same writer keeps a single font object
+                NameObject('/Resources'): page['/Resources'].clone(writer),
+            })
+            self.digit_forms[digit] = writer._add_object(form)
+            self.digit_widths[digit] = pdfmetrics.stringWidth(digit, HEBREW_FONT, size)
+        
+        # Shared "save graphics state" stream that isolates the page content
+        push = DecodedStreamObject()
+        push.set_data(b"q\n")
+        self.push_stream = writer._add_object(push)
+    
+    def stamp(self, page, page_num: int) -> None:
+        """Stamp page_num onto a page that belongs to the writer."""
+        if '/Resources' not in page:
+            page[NameObject('/Resources')] = DictionaryObject()
+        resources = page['/Resources']
+        if '/XObject' not in resources:
+            resources[NameObject('/XObject')] = DictionaryObject()
+        xobjects = resources['/XObject']
+        
+        ops = ["Q"]
+        x = PAGE_NUMBER_X
+        for digit in str(page_num):
+            name = f"{self.NAME_PREFIX}{digit}"
+            xobjects[NameObject(name)] = self.digit_forms[digit]
+            ops.append(f"q 1 0 0 1 {x:.4f} {PAGE_NUMBER_Y} cm {name} Do Q")
+            x += self.digit_widths[digit]
+        
+        stamp = DecodedStreamObject()
+        stamp.set_data(("\n".join(ops) + "\n").encode('ascii'))
+        
+        # Wrap the original content in q/Q and append the stamp
+        contents = ArrayObject([self.push_stream])
+        original = page.raw_get('/Contents') if '/Contents' in page else None
+        if original is not None:
+            if isinstance(original.get_object(), ArrayObject):
+                contents.extend(original.get_object())
+            else:
+                contents.append(original)
+        contents.append(self.writer._add_object(stamp))
+        page[NameObject('/Contents')] = contents
+
+
+def add_page_numbers(pdf_bytes: bytes, compression: str = COMPRESSION) -> bytes:
     """
     Add page numbers to every page of the PDF.
     Just the digit, bottom-left, size 14.
     """
     reader = PdfReader(io.BytesIO(pdf_bytes))
     writer = PdfWriter()
+    stamper = PageNumberStamper(writer)
     
     for page_num, page in enumerate(reader.pages, 1):
-        page_width = float(page.mediabox.width)
-        page_height = float(page.mediabox.height)
+        stamper.stamp(writer.add_page(page), page_num)
+    
+    return write_pdf(writer, compression)
+
+
+def stream_data(stream: StreamObject) -> bytes:
+    """
+    Return the data a stream is written out with. A ContentStream rebuilt from
+    parsed operators (as merge_page leaves the pages it merges onto) only
+    renders its data when asked, and has empty _data until then.
+    """
+    if isinstance(stream, ContentStream):
+        return stream.get_data()
+    return stream._data
+
+
+def object_digest(obj, memo: Dict[int, bytes]) -> bytes:
+    """
+    Content digest of a PDF object that follows indirect references, so
+    copies of an object cloned from different sources digest equal.
+    Digests of indirect objects are memoized in memo by object number.
+    """
+    if isinstance(obj, IndirectObject):
+        if obj.idnum not in memo:
+            memo[obj.idnum] = b'cycle'
+            memo[obj.idnum] = object_digest(obj.get_object(), memo)
+        return memo[obj.idnum]
+    
+    if isinstance(obj, DictionaryObject):
+        digest = hashlib.sha256(b'dict')
+        for key in sorted(obj):
+            digest.update(key.encode('utf-8'))
+            digest.update(object_digest(obj.raw_get(key), memo))
+        if isinstance(obj, StreamObject):
+            digest.update(stream_data(obj))
+    elif isinstance(obj, ArrayObject):
+        digest = hashlib.sha256(b'array')
+        for item in obj:
+            digest.update(object_digest(item, memo))
+    else:
+        digest = hashlib.sha256(f"{type(obj).__name__}:{obj!r}".encode('utf-8'))
+    return digest.digest()
+
+
+def sharing_key(obj, memo: Dict[int, bytes]) -> Optional[bytes]:
+    """
+    Return the key under which obj can be shared with identical objects, or
+    None when it must stay distinct. Streams (images, fonts files, forms,
+    content) and font dicts qualify; pages and other dicts do not. A font's
+    /Name is obsolete and varies with the order fonts were first used on a
+    canvas, so it is left out of the key.
+    """
+    if isinstance(obj, StreamObject):
+        return object_digest(obj, memo)
+    if isinstance(obj, DictionaryObject) and obj.get('/Type') == '/Font':
+        return object_digest(DictionaryObject(
+            (key, value) for key, value in obj.items() if key != '/Name'
+        ), memo)
+    return None
+
+
+def redirect_references(obj, replacements: Dict[int, IndirectObject]) -> None:
+    """Point the references in obj (and its direct children) at their replacements."""
+    if isinstance(obj, DictionaryObject):
+        items = list(obj.items())
+    elif isinstance(obj, ArrayObject):
+        items = list(enumerate(obj))
+    else:
+        return
+    for key, value in items:
+        if isinstance(value, IndirectObject):
+            if value.idnum in replacements:
+                obj[key] = replacements[value.idnum]
+        else:
+            redirect_references(value, replacements)
+
+
+class ByteCounter:
+    """Write-only stream that counts the bytes written to it and keeps none."""
+    
+    def __init__(self):
+        self.count = 0
+    
+    def write(self, data: bytes) -> int:
+        self.count += len(data)
+        return len(data)
+
+
+def drop_unreachable_objects(writer: PdfWriter) -> int:
+    """
+    Remove the objects no longer reachable from the catalog or the info
+    dictionary, so replaced duplicates are not written out.
+    Returns the number of bytes the dropped objects would have taken.
+    """
+    reachable = set()
+    pending = [writer.root_object.indirect_reference]
+    if writer._info is not None:
+        pending.append(writer._info.indirect_reference)
+    
+    while pending:
+        obj = pending.pop()
+        if isinstance(obj, IndirectObject):
+            if obj.idnum in reachable:
+                continue
+            reachable.add(obj.idnum)
+            obj = obj.get_object()
+        if isinstance(obj, DictionaryObject):
+            pending.extend(obj.values())
+        elif isinstance(obj, ArrayObject):
+            pending.extend(obj)
+    
+    dropped = ByteCounter()
+    for idnum, obj in enumerate(writer._objects, 1):
+        if obj is not None and idnum not in reachable:
+            obj.write_to_stream(dropped)
+            writer._objects[idnum - 1] = None
+    return dropped.count
+
+
+def deduplicate_objects(writer: PdfWriter) -> Tuple[int, int]:
+    """
+    Collapse identical streams and fonts onto one shared copy.
+    
+    The same exhibit attached twice, logos and letterheads repeated across
+    appendices, and the font subsets every cover, TOC, marking and digit
+    stamp canvas embeds (identical thanks to prime_font_subsets) are each
+    cloned into the writer separately. Objects are keyed by content (see
+    sharing_key), references to later copies are pointed at the first, and
+    the copies are dropped. Returns the number of objects collapsed and the
+    bytes saved.
+    """
+    memo: Dict[int, bytes] = {}
+    shared: Dict[bytes, IndirectObject] = {}
+    replacements: Dict[int, IndirectObject] = {}
+    
+    for idnum, obj in enumerate(writer._objects, 1):
+        if obj is None:
+            continue
+        key = sharing_key(obj, memo)
+        if key is None:
+            continue
+        first = shared.setdefault(key, IndirectObject(idnum, 0, writer))
+        if first.idnum != idnum:
+            replacements[idnum] = first
+    
+    if not replacements:
+        return 0, 0
+    for obj in writer._objects:
+        redirect_references(obj, replacements)
+    return len(replacements), drop_unreachable_objects(writer)
+
+
+def compress_streams(writer: PdfWriter, compression: str = COMPRESSION) -> Tuple[int, int]:
+    """
+    Flate-compress the writer's uncompressed streams at the level for the
+    compression mode: page number stamps and content from inputs saved
+    without compression. Streams under COMPRESSION_MIN_BYTES, and XMP
+    metadata, which is meant to stay readable, are left alone.
+    Returns the total size of the compressed streams before and after.
+    """
+    if compression == 'off':
+        return 0, 0
+    level = FLATE_LEVELS[compression]
+    before = after = 0
+    
+    for index, obj in enumerate(writer._objects):
+        if (not isinstance(obj, StreamObject) or '/Filter' in obj
+                or len(stream_data(obj)) < COMPRESSION_MIN_BYTES or obj.get('/Type') == '/Metadata'):
+            continue
+        encoded = obj.flate_encode(level)
+        if len(encoded._data) >= len(obj._data):
+            continue
+        encoded.indirect_reference = obj.indirect_reference
+        writer._objects[index] = encoded
+        before += len(obj._data)
+        after += len(encoded._data)
+    
+    return before, after
+
+
+@lru_cache(maxsize=None)
+def qpdf_available() -> bool:
+    """Whether optimize_with_qpdf can run: pikepdf or the qpdf tool is installed."""
+    return importlib.util.find_spec('pikepdf') is not None or shutil.which('qpdf') is not None
+
+
+def optimize_with_qpdf(
+    source_path: str,
+    target_path: str,
+    object_streams: bool = False,
+    linearize: bool = False,
+    compress: bool = True
+) -> bool:
+    """
+    Rewrite a PDF file through qpdf for what pypdf cannot write: objects
+    packed into compressed object streams with a cross-reference stream,
+    and/or a linearized ("fast web view") layout, which lets viewers show the
+    first page while the rest of the file is still downloading.
+    Without compress, qpdf leaves uncompressed streams as they are instead
+    of Flate-compressing them.
+    Uses the pikepdf bindings when installed, else the qpdf command line
+    tool. Returns False, with target_path removed, when neither is
+    available or qpdf fails.
+    """
+    try:
+        import pikepdf
+    except ImportError:
+        pikepdf = None
+    
+    if pikepdf is not None:
+        try:
+            with pikepdf.open(source_path) as pdf:
+                pdf.save(
+                    target_path,
+                    linearize=linearize,
+                    compress_streams=compress,
+                    object_stream_mode=(pikepdf.ObjectStreamMode.generate if object_streams
+                                        else pikepdf.ObjectStreamMode.preserve),
+                )
+        except (pikepdf.PdfError, OSError) as e:
+            print(f"Warning: qpdf failed, writing unoptimized output: {e}")
+            remove_quietly(target_path)
+            return False
+        return True
+    
+    qpdf = shutil.which('qpdf')
+    if qpdf is None:
+        print("Warning: Neither pikepdf nor qpdf is installed, "
+              "writing without object streams or linearization")
+        return False
+    
+    args = [qpdf]
+    if linearize:
+        args.append('--linearize')
+    if object_streams:
+        args.append('--object-streams=generate')
+    if not compress:
+        args.append('--compress-streams=n')
+    result = subprocess.run(args + [source_path, target_path], capture_output=True)
+    # Exit status 3 means success with warnings
+    if result.returncode not in (0, 3):
+        print(f"Warning: qpdf failed, writing unoptimized output: "
+              f"{result.stderr.decode('utf-8', 'replace').strip()}")
+        remove_quietly(target_path)
+        return False
+    return True
+
+
+def write_bundle(
+    writer: PdfWriter,
+    compression: str = COMPRESSION,
+    linearize: bool = False
+) -> BlobHandle:
+    """
+    Write the writer's PDF straight to a temp file in the document store and
+    return its handle, so the output is never held in memory. The file is
+    rewritten through qpdf for 'max' compression or linearization; streams
+    are expected to be compressed already (see compress_streams).
+    """
+    fd, path = make_blob_file()
+    # Created first so the file is cleaned up if writing fails
+    handle = BlobHandle(path, 0)
+    with os.fdopen(fd, 'wb') as f:
+        writer.write(f)
+    
+    if compression == 'max' or linearize:
+        fd, optimized_path = make_blob_file()
+        os.close(fd)
+        try:
+            if optimize_with_qpdf(path, optimized_path, compression == 'max', linearize,
+                                  compression != 'off'):
+                os.replace(optimized_path, path)
+        finally:
+            remove_quietly(optimized_path)
+    
+    handle.size = os.path.getsize(path)
+    return handle
+
+
+def write_pdf(
+    writer: PdfWriter,
+    compression: str = COMPRESSION,
+    linearize: bool = False
+) -> bytes:
+    """
+    Compress the writer's streams and return its PDF as bytes. Output that
+    goes through qpdf is written via a temp file (see write_bundle); the
+    rest is written in memory.
+    """
+    compress_streams(writer, compression)
+    if compression == 'max' or linearize:
+        return write_bundle(writer, compression, linearize).read()
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+class PageCountMismatch(ValueError):
+    """
+    Raised by assemble_bundle when documents have a different number of pages
+    than their parts declare, so a TOC and covers planned from the declared
+    counts would point at the wrong pages. counts maps the index of each such
+    part to the pages it actually has.
+    """
+    
+    def __init__(self, message: str, counts: Dict[int, int]):
+        super().__init__(message)
+        self.counts = counts
+
+
+def assemble_bundle(
+    parts: List[Dict[str, Any]],
+    workers: Optional[int] = None,
+    cache: Optional[Dict[tuple, bytes]] = None,
+    metrics: Optional[List[Dict[str, Any]]] = None,
+    compression: str = COMPRESSION,
+    linearize: bool = False
+) -> BlobHandle:
+    """
+    Assemble the final bundle in a single PdfWriter pass and write it to the
+    document store (see write_bundle).
+    
+    Each part is a dict with 'pdf' (a PdfSource) and an optional 'marking'
+    (the appendix number to stamp on its first page). Parts may also give
+    the 'pages' the page ranges were planned with, and a 'name' for messages:
+    documents whose page trees disagree raise PageCountMismatch before
+    anything is merged. Every input is parsed
+    once, marking and continuous page numbers are merged onto the pages as
+    they are added, and the output is written once. Equivalent to running
+    add_appendix_marking, merge_pdfs and add_page_numbers in sequence.
+    
+    The marking stamps only depend on the first page's geometry, so they are
+    rendered up front on a process pool of `workers` processes, reusing any
+    stamps already in cache (see run_cached).
+    
+    Identical streams and fonts are collapsed onto one shared copy, then
+    uncompressed streams are compressed per the compression mode, before
+    writing (see deduplicate_objects and compress_streams). With linearize
+    the output is laid out for fast web view.
+    
+    The marking, merge, dedup, compress and write stages are recorded in
+    metrics (see measure_stage); the dedup record also has 'bytes_saved'.
+    """
+    with ExitStack() as stack:
+        # Spilled documents stay open until the output has been written
+        readers = [
+            PdfReader(stack.enter_context(open_pdf_source(part['pdf'])))
+            for part in parts
+        ]
         
-        overlay_buffer = io.BytesIO()
-        c = canvas.Canvas(overlay_buffer, pagesize=(page_width, page_height))
+        mismatched = {
+            i: len(reader.pages) for i, (part, reader) in enumerate(zip(parts, readers))
+            if 'pages' in part and len(reader.pages) != part['pages']
+        }
+        if mismatched:
+            raise PageCountMismatch(", ".join(
+                f"{parts[i].get('name', 'A document')} has {count} pages, "
+                f"not the {parts[i]['pages']} planned"
+                for i, count in mismatched.items()
+            ), mismatched)
+        
+        with measure_stage(metrics, 'marking') as stage:
+            marked = [
+                i for i, part in enumerate(parts)
+                if part.get('marking') and len(readers[i].pages) > 0
+            ]
+            overlays = run_cached(make_marking_overlay, [
+                (parts[i]['marking'], *marking_geometry(readers[i].pages[0]), compression)
+                for i in marked
+            ], workers, cache)
+            overlay_by_part = dict(zip(marked, overlays))
+            stage['pages'] = len(marked)
+            stage['bytes_out'] = sum(len(overlay) for overlay in overlays)
+        
+        with measure_stage(metrics, 'merge') as stage:
+            writer = PdfWriter()
+            stamper = PageNumberStamper(writer)
+            page_num = 0
+            overlay_readers = []
+            
+            for part_index, (part, reader) in enumerate(zip(parts, readers)):
+                marking = part.get('marking')
+                
+                for i, page in enumerate(reader.pages):
+                    page = writer.add_page(page)
+                    if i == 0 and marking:
+                        overlay_readers.append(
+                            mark_first_page(page, overlay_by_part[part_index])
+                        )
+                    page_num += 1
+                    stamper.stamp(page, page_num)
+            
+            stage['pages'] = page_num
+            stage['bytes_in'] = sum(source_size(part['pdf']) for part in parts)
         
-        # Page number: just the digit, bottom-left, size 14
-        c.setFont(HEBREW_FONT, 14)
-        c.drawString(30, 25, str(page_num))
-        c.save()
+        with measure_stage(metrics, 'dedup') as stage:
+            _, stage['bytes_saved'] = deduplicate_objects(writer)
+            stage['pages'] = page_num
         
-        overlay_buffer.seek(0)
-        overlay_reader = PdfReader(overlay_buffer)
+        with measure_stage(metrics, 'compress') as stage:
+            stage['bytes_in'], stage['bytes_out'] = compress_streams(writer, compression)
+            stage['pages'] = page_num
         
-        page.merge_page(overlay_reader.pages[0])
-        writer.add_page(page)
+        with measure_stage(metrics, 'write') as stage:
+            bundle = write_bundle(writer, compression, linearize)
+            stage['pages'] = page_num
+            stage['bytes_out'] = bundle.size
     
-    output = io.BytesIO()
-    writer.write(output)
-    output.seek(0)
-    return output.read()
+    return bundle
 
 
 def two_pass_generate(
-    main_pdf: bytes,
+    main_pdf: PdfSource,
     main_pages: int,
     appendices: List[Dict[str, Any]],
-    settings: Dict[str, Any]
-) -> bytes:
-    """Two-pass generation for accurate TOC page numbers."""
+    settings: Dict[str, Any],
+    cache: Optional[Dict[str, Dict[tuple, bytes]]] = None,
+    metrics: Optional[List[Dict[str, Any]]] = None
+) -> BlobHandle:
+    """
+    Generate the final bundle with accurate TOC page numbers and return the
+    handle of its temp file (see write_bundle).
+    The TOC page count comes from plan_toc_pages, so page ranges are known
+    before anything is drawn and the TOC is rendered only once.
+    Each appendix is a dict with 'pdf' (a PdfSource), 'pages' and 'title'.
+    
+    Passing the same cache dict to successive calls makes regeneration
+    incremental: covers and marking stamps whose inputs are unchanged are
+    reused, so a title edit only re-renders the TOC and that one cover.
+    
+    When metrics is a list, a record per stage (toc, covers, marking, merge,
+    dedup, compress, write) with wall/CPU time, pages and bytes in/out is
+    appended to it.
+    
+    Should a document turn out to have a different number of pages than
+    given (see PageCountMismatch), the bundle is planned again with the
+    actual counts.
+    """
     numbering_format = settings.get('numbering', 'hebrew')
     template = settings.get('template', 'classic')
     add_marking = settings.get('add_marking', True)
+    workers = settings.get('workers')
+    compression = settings.get('compression', COMPRESSION)
+    linearize = settings.get('linearize', False)
+    if compression not in COMPRESSION_MODES:
+        raise ValueError(f"Unknown compression '{compression}', expected one of: "
+                         f"{', '.join(COMPRESSION_MODES)}")
     
-    # ==========================================================================
-    # PASS 1: Estimate TOC pages and calculate page ranges
-    # ==========================================================================
-    draft_entries = []
-    estimated_toc_pages = 1
-    current_page = main_pages + estimated_toc_pages + 1
+    toc_pages = len(plan_toc_pages(len(appendices)))
     
-    for i, appendix in enumerate(appendices, 1):
-        start_page = current_page
-        # Cover sheet (1 page) + appendix content
-        end_page = current_page + appendix['pages']
-        
-        draft_entries.append({
-            'number': get_appendix_number(i, numbering_format),
-            'title': appendix['title'],
-            'start_page': start_page,
-            'end_page': end_page
-        })
-        current_page = end_page + 1
-    
-    _, actual_toc_pages = make_toc_pdf(draft_entries, template)
-    
-    # ==========================================================================
-    # PASS 2: Generate with correct page numbers
-    # ==========================================================================
     final_entries = []
-    current_page = main_pages + actual_toc_pages + 1
+    current_page = main_pages + toc_pages + 1
     
     appendix_page_info = []
     
     for i, appendix in enumerate(appendices, 1):
         start_page = current_page
+        # Cover sheet (1 page) + appendix content
         end_page = current_page + appendix['pages']
         
         appendix_info = {
@@ -620,84 +1808,167 @@ def two_pass_generate(
         
         current_page = end_page + 1
     
-    toc_pdf, _ = make_toc_pdf(final_entries, template)
+    with measure_stage(metrics, 'toc') as stage:
+        toc_pdf, _ = make_toc_pdf(final_entries, template, compression)
+        stage['pages'] = toc_pages
+        stage['bytes_out'] = len(toc_pdf)
+    
+    # Build the part list for single-pass assembly
+    parts = [
+        {'pdf': main_pdf, 'pages': main_pages, 'name': 'The main document'},
+        {'pdf': toc_pdf},
+    ]
     
-    # Build PDF list
-    pdf_list = [main_pdf, toc_pdf]
+    # Cover sheets with page range, rendered in parallel
+    with measure_stage(metrics, 'covers') as stage:
+        cover_pdfs = run_cached(make_cover_pdf, [
+            (info['number'], info['title'], info['start_page'], info['end_page'], template,
+             compression)
+            for info in appendix_page_info
+        ], workers, None if cache is None else cache.setdefault('covers', {}))
+        stage['pages'] = len(cover_pdfs)
+        stage['bytes_out'] = sum(len(cover) for cover in cover_pdfs)
     
+    appendix_parts = []
     for i, appendix in enumerate(appendices):
         info = appendix_page_info[i]
         
-        # Cover sheet with page range (no title per user request)
-        cover_pdf = make_cover_pdf(
-            info['number'],
-            appendix['title'],  # Still passed but not displayed
-            info['start_page'],
-            info['end_page'],
-            template
-        )
-        pdf_list.append(cover_pdf)
+        parts.append({'pdf': cover_pdfs[i]})
         
         # Appendix content (with optional marking)
-        appendix_pdf = appendix['pdf_bytes']
-        if add_marking:
-            appendix_pdf = add_appendix_marking(appendix_pdf, info['number'])
-        pdf_list.append(appendix_pdf)
-    
-    # Merge and add page numbers
-    merged_pdf = merge_pdfs(pdf_list)
-    final_pdf = add_page_numbers(merged_pdf)
+        appendix_parts.append(len(parts))
+        parts.append({
+            'pdf': appendix['pdf'],
+            'marking': info['number'] if add_marking else None,
+            'pages': appendix['pages'],
+            'name': f"Appendix {info['number']}",
+        })
     
-    return final_pdf
+    # Mark, merge and add page numbers in one pass
+    try:
+        return assemble_bundle(
+            parts, workers, None if cache is None else cache.setdefault('markings', {}), metrics,
+            compression, linearize
+        )
+    except PageCountMismatch as e:
+        # A page tree that misstates its own size got past count_pdf_pages:
+        # plan again with the pages the documents actually have
+        print(f"Warning: {e}; planning the bundle again")
+        appendices = [
+            dict(appendix, pages=e.counts.get(index, appendix['pages']))
+            for appendix, index in zip(appendices, appendix_parts)
+        ]
+        return two_pass_generate(
+            main_pdf, e.counts.get(0, main_pages), appendices, settings, cache, metrics
+        )
 
 
 # =============================================================================
 # PROJECT SAVE/LOAD
 # =============================================================================
 
-def save_project() -> bytes:
-    """Export current project state to JSON bytes."""
-    project_data = {
-        'version': '2.2',
-        'created': datetime.now().isoformat(),
+PROJECT_VERSION = '3.0'
+PROJECT_MANIFEST = 'manifest.json'
+
+
+def project_snapshot() -> Dict[str, Any]:
+    """
+    Capture the project state save_project writes from the session.
+    The snapshot is detached from session state, so it can be saved after
+    the script run, e.g. from a deferred download.
+    """
+    return {
         'numbering': st.session_state.get('numbering', 'אבג (Hebrew)'),
         'template': st.session_state.get('template', 'קלאסי (Classic)'),
         'add_marking': st.session_state.get('add_marking', True),
+        'linearize': st.session_state.get('linearize', False),
         'main_index': st.session_state.get('main_index', 0),
-        'files': []
+        'files': [dict(f) for f in st.session_state.get('files_data', [])],
     }
+
+
+def save_project(target: BinaryIO, project: Optional[Dict[str, Any]] = None) -> None:
+    """
+    Write a project snapshot (default: the current session's) to target as
+    a zip container.
+    The container holds manifest.json plus one stored (uncompressed) PDF
+    member per file. Members are streamed from the document store, so the
+    project is never built in memory.
+    """
+    if project is None:
+        project = project_snapshot()
     
-    for f in st.session_state.get('files_data', []):
-        file_entry = {
-            'name': f['name'],
-            'title': f['title'],
-            'pages': f['pages'],
-            'pdf_base64': base64.b64encode(f['pdf_bytes']).decode('utf-8')
-        }
-        project_data['files'].append(file_entry)
+    project_data = {
+        'version': PROJECT_VERSION,
+        'created': datetime.now().isoformat(),
+        'numbering': project['numbering'],
+        'template': project['template'],
+        'add_marking': project['add_marking'],
+        'linearize': project['linearize'],
+        'main_index': project['main_index'],
+        'files': []
+    }
     
-    return json.dumps(project_data, ensure_ascii=False, indent=2).encode('utf-8')
+    with zipfile.ZipFile(target, 'w', compression=zipfile.ZIP_STORED) as zf:
+        for i, f in enumerate(project['files']):
+            member = f"files/{i:04d}.pdf"
+            with f['blob'].open() as src, zf.open(member, 'w', force_zip64=True) as dst:
+                shutil.copyfileobj(src, dst)
+            
+            project_data['files'].append({
+                'name': f['name'],
+                'title': f['title'],
+                'pages': f['pages'],
+                'member': member
+            })
+        
+        zf.writestr(PROJECT_MANIFEST, json.dumps(project_data, ensure_ascii=False, indent=2))
+
+
+def export_project(project: Optional[Dict[str, Any]] = None) -> BlobHandle:
+    """Save a project snapshot to a temp file in the document store (see save_project)."""
+    fd, path = make_blob_file('.zip')
+    with os.fdopen(fd, 'wb') as f:
+        save_project(f, project)
+    return BlobHandle(path, os.path.getsize(path))
 
 
-def load_project(json_bytes: bytes) -> bool:
-    """Load project state from JSON bytes."""
+def load_project(source: BinaryIO) -> bool:
+    """
+    Load project state from a zip container, or a legacy (v2) JSON project.
+    Zip members are streamed straight into the document store.
+    """
     try:
-        project_data = json.loads(json_bytes.decode('utf-8'))
+        files_data = []
+        if zipfile.is_zipfile(source):
+            source.seek(0)
+            with zipfile.ZipFile(source) as zf:
+                project_data = json.loads(zf.read(PROJECT_MANIFEST).decode('utf-8'))
+                for f in project_data.get('files', []):
+                    with zf.open(f['member']) as member:
+                        blob = store_blob(member)
+                    files_data.append({
+                        'name': f['name'],
+                        'title': f['title'],
+                        'pages': f['pages'],
+                        'blob': blob
+                    })
+        else:
+            source.seek(0)
+            project_data = json.loads(source.read().decode('utf-8'))
+            for f in project_data.get('files', []):
+                files_data.append({
+                    'name': f['name'],
+                    'title': f['title'],
+                    'pages': f['pages'],
+                    'blob': store_blob(base64.b64decode(f['pdf_base64']))
+                })
         
         st.session_state.numbering = project_data.get('numbering', 'אבג (Hebrew)')
         st.session_state.template = project_data.get('template', 'קלאסי (Classic)')
         st.session_state.add_marking = project_data.get('add_marking', True)
+        st.session_state.linearize = project_data.get('linearize', False)
         st.session_state.main_index = project_data.get('main_index', 0)
-        
-        files_data = []
-        for f in project_data.get('files', []):
-            files_data.append({
-                'name': f['name'],
-                'title': f['title'],
-                'pages': f['pages'],
-                'pdf_bytes': base64.b64decode(f['pdf_base64'])
-            })
-        
         st.session_state.files_data = files_data
         return True
     except Exception as e:
@@ -716,6 +1987,7 @@ def main():
         layout="wide",
         initial_sidebar_state="expanded"
     )
+    configure_logging()
     
     # Initialize session state
     if 'files_data' not in st.session_state:
@@ -728,6 +2000,8 @@ def main():
         st.session_state.template = 'קלאסי (Classic)'
     if 'add_marking' not in st.session_state:
         st.session_state.add_marking = True
+    if 'linearize' not in st.session_state:
+        st.session_state.linearize = False
     
     # RTL CSS for Hebrew
     st.markdown("""
@@ -770,27 +2044,41 @@ def main():
             key='marking_check'
         )
         
+        # Fast web view
+        can_linearize = qpdf_available()
+        st.session_state.linearize = st.checkbox(
+            UI_TEXT['linearize'],
+            value=st.session_state.linearize and can_linearize,
+            help=UI_TEXT['linearize_help'],
+            key='linearize_check',
+            disabled=not can_linearize
+        ) and can_linearize
+        if not can_linearize:
+            st.warning(UI_TEXT['linearize_unavailable'])
+        
         st.divider()
         
         # Project save/load
         st.subheader(f"💾 {UI_TEXT['project']}")
         
         if st.session_state.files_data:
-            project_bytes = save_project()
+            # Deferred: the zip is only built when the button is clicked
+            project = project_snapshot()
             st.download_button(
                 label=f"📥 {UI_TEXT['save_project']}",
-                data=project_bytes,
-                file_name=f"project_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
-                mime="application/json"
+                data=lambda: export_project(project).read(),
+                file_name=f"project_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip",
+                mime="application/zip",
+                on_click='ignore'
             )
         
         uploaded_project = st.file_uploader(
             UI_TEXT['load_project'],
-            type=['json'],
+            type=['zip', 'json'],
             key='project_upload'
         )
         if uploaded_project:
-            if load_project(uploaded_project.read()):
+            if load_project(uploaded_project):
                 st.success("✅ הפרויקט נטען בהצלחה")
                 st.rerun()
     
@@ -820,7 +2108,7 @@ def main():
                     st.session_state.files_data.append({
                         'name': uploaded_file.name,
                         'title': '',  # Empty by default
-                        'pdf_bytes': pdf_bytes,
+                        'blob': store_blob(pdf_bytes),
                         'pages': page_count
                     })
                 except Exception as e:
@@ -928,9 +2216,12 @@ def main():
             
             numbering_format = NUMBERING_FORMATS[st.session_state.numbering]
             
+            toc_pages = len(plan_toc_pages(len(appendices)))
+            toc_label = "עמוד אחד" if toc_pages == 1 else f"{toc_pages} {UI_TEXT['pages']}"
+            
             st.markdown(f"""
             **{UI_TEXT['main_doc']}**: {main_data['name']} ({main_data['pages']} {UI_TEXT['pages']})  
-            **תוכן עניינים** (עמוד אחד)
+            **תוכן עניינים** ({toc_label})
             """)
             
             for i, app in enumerate(appendices, 1):
@@ -943,11 +2234,11 @@ def main():
             if st.button(f"🚀 {UI_TEXT['generate']}", type="primary"):
                 with st.spinner(UI_TEXT['generating']):
                     try:
-                        main_pdf = main_data['pdf_bytes']
+                        main_pdf = main_data['blob']
                         main_pages = main_data['pages']
                         
                         appendix_list = [{
-                            'pdf_bytes': a['pdf_bytes'],
+                            'pdf': a['blob'],
                             'pages': a['pages'],
                             'title': a['title']
                         } for a in appendices]
@@ -956,20 +2247,43 @@ def main():
                             'numbering': NUMBERING_FORMATS[st.session_state.numbering],
                             'template': TEMPLATES[st.session_state.template],
                             'add_marking': st.session_state.add_marking,
+                            'linearize': st.session_state.linearize,
                         }
                         
-                        final_pdf = two_pass_generate(main_pdf, main_pages, appendix_list, settings)
+                        # Reused across runs so only changed covers/stamps re-render
+                        generation_cache = st.session_state.setdefault('generation_cache', {})
+                        metrics = []
+                        with ExitStack() as stack:
+                            if PROFILE_MEMORY:
+                                # Workers are not traced, so keep all work in-process
+                                settings['workers'] = 1
+                                memory_report = stack.enter_context(profile_memory())
+                            final_pdf = two_pass_generate(
+                                main_pdf, main_pages, appendix_list, settings, generation_cache,
+                                metrics
+                            )
                         
-                        reader = PdfReader(io.BytesIO(final_pdf))
-                        final_pages = len(reader.pages)
+                        final_pages = bundle_page_count(
+                            main_pages, [a['pages'] for a in appendix_list]
+                        )
                         
                         st.success(f"✅ {UI_TEXT['success']} ({final_pages} {UI_TEXT['pages']})")
                         
+                        total_seconds = sum(stage['wall_s'] for stage in metrics)
+                        with st.expander(f"⏱️ {UI_TEXT['stage_metrics']} ({total_seconds:.2f}s)"):
+                            st.table(metrics)
+                            if PROFILE_MEMORY:
+                                st.markdown(f"**{UI_TEXT['memory_peak']}**: "
+                                            f"{memory_report['peak'] / 1024 / 1024:.1f} MB")
+                                st.table(memory_report['top_sites'])
+                        
+                        # Deferred: the PDF is only read from its temp file on click
                         st.download_button(
                             label=f"📥 {UI_TEXT['download']}",
-                            data=final_pdf,
+                            data=final_pdf.read,
                             file_name=f"merged_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf",
-                            mime="application/pdf"
+                            mime="application/pdf",
+                            on_click='ignore'
                         )
                         
                     except Exception as e:
@@ -0,0 +1,235 @@
+"""
+Benchmark harness for the PDF pipeline.
+
+Generates a synthetic bundle corpus (N appendices x M pages, rotated pages,
+mixed page sizes and large images), times each pipeline stage separately and
+writes a machine-readable JSON report that can be compared across versions:
+    
+    python bench.py --appendices 50 --pages 10 --images 4 --repeat 3
+    python bench.py --output before.json   # ...later: --output after.json
+"""
+
+import argparse
+import io
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+import pypdf
+import reportlab
+from PIL import Image
+from pypdf import PdfReader, PdfWriter
+from reportlab.lib.pagesizes import A4, LEGAL, LETTER, landscape
+from reportlab.pdfgen import canvas
+
+import app
+
+PAGE_SIZES = [A4, LETTER, landscape(A4), LEGAL]
+ROTATIONS = [0, 90, 180, 270]
+
+
+class NamedBytesIO(io.BytesIO):
+    """In-memory upload with a file name, like Streamlit's UploadedFile."""
+    
+    def __init__(self, name: str, data: bytes):
+        super().__init__(data)
+        self.name = name
+
+
+def make_document(page_count: int, label: str, page_size, rotation: int = 0) -> bytes:
+    """Create a text PDF with page_count pages, optionally rotated."""
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=page_size)
+    for page in range(1, page_count + 1):
+        c.setFont('Helvetica', 12)
+        for line in range(40):
+            c.drawString(72, page_size[1] - 72 - line * 16,
+                         f"{label} page {page} line {line} - synthetic benchmark text")
+        c.showPage()
+    c.save()
+    
+    if not rotation:
+        return buffer.getvalue()
+    
+    reader = PdfReader(io.BytesIO(buffer.getvalue()))
+    writer = PdfWriter()
+    for page in reader.pages:
+        page.rotate(rotation)
+        writer.add_page(page)
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+def make_image(megapixels: float, image_format: str) -> bytes:
+    """Create a photo-like noisy image of roughly the given size."""
+    width = int((megapixels * 1_000_000 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    noise = Image.effect_noise((width // 8, height // 8), 64).resize((width, height))
+    img = Image.merge('RGB', (noise, noise.rotate(90, expand=False), noise.transpose(0)))
+    buffer = io.BytesIO()
+    img.save(buffer, format=image_format, **({'quality': 85} if image_format == 'JPEG' else {}))
+    return buffer.getvalue()
+
+
+def make_corpus(appendix_count: int, pages: int, image_count: int, megapixels: float):
+    """
+    Build the synthetic uploads: a main document and appendices cycling
+    through page sizes and rotations, the last image_count of them large
+    JPEG/PNG photos.
+    """
+    uploads = [NamedBytesIO('main.pdf', make_document(pages, 'main', A4))]
+    for i in range(appendix_count):
+        if i >= appendix_count - image_count:
+            image_format = 'JPEG' if i % 2 == 0 else 'PNG'
+            uploads.append(NamedBytesIO(f'photo{i}.{image_format.lower()}',
+                                        make_image(megapixels, image_format)))
+        else:
+            uploads.append(NamedBytesIO(f'appendix{i}.pdf', make_document(
+                pages, f'appendix {i}', PAGE_SIZES[i % len(PAGE_SIZES)],
+                ROTATIONS[(i // len(PAGE_SIZES)) % len(ROTATIONS)]
+            )))
+    return uploads
+
+
+def time_stage(func: Callable[[], Any], repeat: int) -> Dict[str, Any]:
+    """Run func repeat times and summarize wall time; returns the last result too."""
+    seconds = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        seconds.append(time.perf_counter() - start)
+    return {
+        'seconds': [round(s, 4) for s in seconds],
+        'min': round(min(seconds), 4),
+        'median': round(statistics.median(seconds), 4),
+        'result': result,
+    }
+
+
+def output_size(result) -> int:
+    """Total bytes produced by a stage result."""
+    if isinstance(result, bytes):
+        return len(result)
+    if isinstance(result, app.BlobHandle):
+        return result.size
+    if isinstance(result, tuple):
+        return output_size(result[0])
+    return sum(output_size(r) for r in result)
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run_benchmark(args) -> Dict[str, Any]:
+    # Cold numbers: never serve normalized uploads or parsed fonts from the disk caches
+    app.CACHE_MAX_BYTES = 0
+    app.FONT_CACHE_DIR = ''
+    
+    uploads = make_corpus(args.appendices, args.pages, args.images, args.megapixels)
+    bytes_in = sum(len(u.getvalue()) for u in uploads)
+    stages: Dict[str, Dict[str, Any]] = {}
+    
+    stages['load_and_normalize_file'] = time_stage(
+        lambda: [app.load_and_normalize_file(u) for u in uploads], args.repeat)
+    normalized = stages['load_and_normalize_file']['result']
+    
+    (main_pdf, main_pages), appendix_docs = normalized[0], normalized[1:]
+    toc_pages = len(app.plan_toc_pages(len(appendix_docs)))
+    entries = []
+    current_page = main_pages + toc_pages + 1
+    for i, (_, pages) in enumerate(appendix_docs, 1):
+        entries.append({
+            'number': app.get_appendix_number(i, 'hebrew'),
+            'title': f'נספח בדיקה {i} - Benchmark exhibit',
+            'start_page': current_page,
+            'end_page': current_page + pages,
+        })
+        current_page += pages + 1
+    
+    stages['make_toc_pdf'] = time_stage(
+        lambda: app.make_toc_pdf(entries, 'classic'), args.repeat)
+    toc_pdf = stages['make_toc_pdf']['result'][0]
+    
+    stages['make_cover_pdf'] = time_stage(
+        lambda: [app.make_cover_pdf(e['number'], e['title'], e['start_page'], e['end_page'])
+                 for e in entries], args.repeat)
+    covers = stages['make_cover_pdf']['result']
+    
+    stages['add_appendix_marking'] = time_stage(
+        lambda: [app.add_appendix_marking(pdf, e['number'])
+                 for (pdf, _), e in zip(appendix_docs, entries)], args.repeat)
+    marked = stages['add_appendix_marking']['result']
+    
+    pdf_list = [main_pdf, toc_pdf]
+    for cover, appendix in zip(covers, marked):
+        pdf_list += [cover, appendix]
+    stages['merge_pdfs'] = time_stage(lambda: app.merge_pdfs(pdf_list), args.repeat)
+    merged = stages['merge_pdfs']['result']
+    
+    stages['add_page_numbers'] = time_stage(lambda: app.add_page_numbers(merged), args.repeat)
+    
+    appendices = [{'pdf': pdf, 'pages': pages, 'title': e['title']}
+                  for (pdf, pages), e in zip(appendix_docs, entries)]
+    settings = {'numbering': 'hebrew', 'template': 'classic', 'add_marking': True,
+                'workers': args.workers}
+    stages['two_pass_generate'] = time_stage(
+        lambda: app.two_pass_generate(main_pdf, main_pages, appendices, settings), args.repeat)
+    
+    for stage in stages.values():
+        stage['bytes_out'] = output_size(stage.pop('result'))
+    
+    return {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'pypdf': pypdf.__version__,
+        'reportlab': reportlab.Version,
+        'corpus': {
+            'appendices': args.appendices,
+            'pages_per_document': args.pages,
+            'images': args.images,
+            'image_megapixels': args.megapixels,
+            'bytes_in': bytes_in,
+            'final_pages': app.bundle_page_count(main_pages,
+                                                 [pages for _, pages in appendix_docs]),
+        },
+        'repeat': args.repeat,
+        'stages': stages,
+    }
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark each stage of the PDF pipeline.")
+    parser.add_argument('--appendices', type=int, default=20, help="Number of appendices (N)")
+    parser.add_argument('--pages', type=int, default=5, help="Pages per PDF document (M)")
+    parser.add_argument('--images', type=int, default=2,
+                        help="How many of the appendices are large photos")
+    parser.add_argument('--megapixels', type=float, default=12, help="Size of each photo")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per stage")
+    parser.add_argument('--workers', type=int, help="Render workers for two_pass_generate")
+    parser.add_argument('--output', default='bench_output.json', help="JSON report path")
+    args = parser.parse_args(argv)
+    
+    report = run_benchmark(args)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    
+    print(f"{'stage':<26}{'min s':>10}{'median s':>10}{'bytes out':>14}")
+    for name, stage in report['stages'].items():
+        print(f"{name:<26}{stage['min']:>10.3f}{stage['median']:>10.3f}{stage['bytes_out']:>14,}")
+    print(f"Report written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,340 @@
+"""
+Command-line entry point for headless merges.
+
+Builds a merged PDF from a manifest describing the main document, the ordered
+appendices and the generation settings, without a browser or Streamlit server:
+    
+    python cli.py build case/manifest.json -o case/merged.pdf
+    python cli.py batch cases/ --workers 8 --report report.json
+
+In batch mode every subdirectory of cases/ holding a manifest is one bundle;
+bundles are built concurrently on a bounded process pool.
+
+Manifest (JSON, or YAML when PyYAML is installed), paths relative to it:
+    
+    {
+        "main": "main.pdf",
+        "appendices": [
+            {"path": "exhibit1.pdf", "title": "הסכם"},
+            {"path": "photo.jpg", "title": "תמונה"}
+        ],
+        "numbering": "hebrew",      # hebrew / arabic / roman
+        "template": "classic",      # classic / modern / minimal
+        "add_marking": true,
+        "compression": "fast",      # off / fast / max
+        "linearize": false,         # fast web view (needs pikepdf or qpdf)
+        "output": "merged.pdf"
+    }
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Tuple
+
+from pypdf.errors import PdfReadError
+
+from app import (
+    COMPRESSION,
+    COMPRESSION_MODES,
+    DEFAULT_WORKERS,
+    NUMBERING_FORMATS,
+    POOL_START_METHOD,
+    TEMPLATES,
+    bundle_page_count,
+    init_render_worker,
+    load_and_normalize_file,
+    profile_memory,
+    store_blob,
+    two_pass_generate,
+)
+
+
+def check_entry(entry, label: str) -> None:
+    """Raise ValueError unless entry is a file path or an object with a text 'path'."""
+    if isinstance(entry, dict):
+        path, title = entry.get('path'), entry.get('title', '')
+    else:
+        path, title = entry, ''
+    if not isinstance(path, str) or not path:
+        raise ValueError(f"{label} must be a file path or an object with a 'path'")
+    if not isinstance(title, str):
+        raise ValueError(f"{label} has a 'title' that is not text")
+
+
+def load_manifest(manifest_path: str) -> Dict[str, Any]:
+    """Read and validate a bundle manifest."""
+    with open(manifest_path, encoding='utf-8') as f:
+        if manifest_path.lower().endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError:
+                raise ValueError("YAML manifests require PyYAML (pip install pyyaml)")
+            manifest = yaml.safe_load(f)
+        else:
+            manifest = json.load(f)
+    
+    if not isinstance(manifest, dict):
+        raise ValueError("Manifest must be an object")
+    if not manifest.get('main'):
+        raise ValueError("Manifest has no 'main' document")
+    if not manifest.get('appendices'):
+        raise ValueError("Manifest needs at least one appendix")
+    if not isinstance(manifest['appendices'], list):
+        raise ValueError("Manifest 'appendices' must be a list")
+    check_entry(manifest['main'], "The 'main' document")
+    for i, entry in enumerate(manifest['appendices'], 1):
+        check_entry(entry, f"Appendix {i}")
+    if not isinstance(manifest.get('output', ''), str):
+        raise ValueError("Manifest 'output' must be a file path")
+    
+    numbering = manifest.get('numbering', 'hebrew')
+    if numbering not in NUMBERING_FORMATS.values():
+        raise ValueError(f"Unknown numbering '{numbering}', expected one of: "
+                         f"{', '.join(NUMBERING_FORMATS.values())}")
+    template = manifest.get('template', 'classic')
+    if template not in TEMPLATES.values():
+        raise ValueError(f"Unknown template '{template}', expected one of: "
+                         f"{', '.join(TEMPLATES.values())}")
+    compression = manifest.get('compression', COMPRESSION)
+    if compression not in COMPRESSION_MODES:
+        raise ValueError(f"Unknown compression '{compression}', expected one of: "
+                         f"{', '.join(COMPRESSION_MODES)}")
+    
+    return manifest
+
+
+def entry_path(entry, base_dir: str) -> str:
+    """Resolve a manifest file entry (a path or {"path": ...}) against base_dir."""
+    path = entry['path'] if isinstance(entry, dict) else entry
+    return os.path.join(base_dir, path)
+
+
+def load_document(path: str):
+    """Normalize a document from disk and spill it to the document store."""
+    with open(path, 'rb') as f:
+        pdf_bytes, page_count = load_and_normalize_file(f)
+    return store_blob(pdf_bytes), page_count
+
+
+def build_bundle(
+    manifest_path: str,
+    output_path: Optional[str] = None,
+    workers: Optional[int] = None
+) -> Tuple[str, int]:
+    """
+    Build the bundle described by a manifest.
+    Returns the output path and the page count of the merged PDF.
+    """
+    manifest = load_manifest(manifest_path)
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    
+    main_blob, main_pages = load_document(entry_path(manifest['main'], base_dir))
+    
+    appendices: List[Dict[str, Any]] = []
+    for entry in manifest['appendices']:
+        blob, pages = load_document(entry_path(entry, base_dir))
+        appendices.append({
+            'pdf': blob,
+            'pages': pages,
+            'title': entry.get('title', '') if isinstance(entry, dict) else '',
+        })
+    
+    settings = {
+        'numbering': manifest.get('numbering', 'hebrew'),
+        'template': manifest.get('template', 'classic'),
+        'add_marking': manifest.get('add_marking', True),
+        'compression': manifest.get('compression', COMPRESSION),
+        'linearize': manifest.get('linearize', False),
+        'workers': workers,
+    }
+    
+    final_pdf = two_pass_generate(main_blob, main_pages, appendices, settings)
+    
+    if output_path is None:
+        output_path = os.path.join(base_dir, manifest.get('output', 'merged.pdf'))
+    # Copied rather than renamed: the temp file is private to this user, and
+    # the output should get the usual permissions
+    shutil.copyfile(final_pdf.path, output_path)
+    
+    return output_path, bundle_page_count(main_pages, [a['pages'] for a in appendices])
+
+
+MANIFEST_NAMES = ('manifest.json', 'manifest.yaml', 'manifest.yml')
+
+
+def find_manifests(cases_dir: str) -> List[str]:
+    """Return the manifest of every case folder directly under cases_dir."""
+    manifests = []
+    for name in sorted(os.listdir(cases_dir)):
+        case_dir = os.path.join(cases_dir, name)
+        if not os.path.isdir(case_dir):
+            continue
+        for manifest_name in MANIFEST_NAMES:
+            manifest_path = os.path.join(case_dir, manifest_name)
+            if os.path.isfile(manifest_path):
+                manifests.append(manifest_path)
+                break
+    return manifests
+
+
+def case_result(manifest_path: str) -> Dict[str, Any]:
+    """Return the empty batch result record of a case."""
+    return {
+        'case': os.path.basename(os.path.dirname(os.path.abspath(manifest_path))),
+        'manifest': manifest_path,
+        'output': None,
+        'pages': None,
+        'seconds': None,
+        'error': None,
+    }
+
+
+def run_case(manifest_path: str) -> Dict[str, Any]:
+    """
+    Build one bundle for the batch runner and report how it went.
+    Never raises: failures are returned in the result's 'error'.
+    """
+    result = case_result(manifest_path)
+    start = time.perf_counter()
+    try:
+        # One render process per bundle: the batch pool is the parallelism
+        result['output'], result['pages'] = build_bundle(manifest_path, workers=1)
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+        result['traceback'] = traceback.format_exc()
+    result['seconds'] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def print_case_result(result: Dict[str, Any]) -> None:
+    """Print the one-line batch status of a finished bundle."""
+    if result['error']:
+        seconds = '-' if result['seconds'] is None else f"{result['seconds']:.2f}s"
+        print(f"FAIL {result['case']} ({seconds}): {result['error']}", flush=True)
+    else:
+        print(f"OK   {result['case']} ({result['seconds']:.2f}s, {result['pages']} pages)",
+              flush=True)
+
+
+def run_batch(cases_dir: str, workers: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Build every case under cases_dir concurrently on a bounded process pool.
+    Prints a line per bundle as it finishes and returns the results in case
+    order. A case whose worker process dies (e.g. killed for running out of
+    memory) is reported as failed, as are the cases the broken pool could
+    not finish.
+    """
+    manifests = find_manifests(cases_dir)
+    workers = max(1, min(workers or DEFAULT_WORKERS, len(manifests)))
+    
+    results: Dict[str, Dict[str, Any]] = {}
+    if workers == 1:
+        for manifest_path in manifests:
+            results[manifest_path] = run_case(manifest_path)
+            print_case_result(results[manifest_path])
+    else:
+        with ProcessPoolExecutor(max_workers=workers,
+                                 mp_context=multiprocessing.get_context(POOL_START_METHOD),
+                                 initializer=init_render_worker) as executor:
+            futures = {
+                executor.submit(run_case, manifest_path): manifest_path
+                for manifest_path in manifests
+            }
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = case_result(futures[future])
+                    result['error'] = f"{type(e).__name__}: {e}"
+                results[result['manifest']] = result
+                print_case_result(result)
+    
+    return [results[manifest_path] for manifest_path in manifests]
+
+
+def print_memory_report(report: Dict[str, Any]) -> None:
+    """Print a profile_memory report: per-stage deltas, peak and top sites."""
+    mb = 1024 * 1024
+    print(f"{'stage':<12}{'delta MB':>10}{'peak MB':>10}")
+    for stage in report['stages']:
+        print(f"{stage['stage']:<12}{stage['mem_delta'] / mb:>10.1f}{stage['mem_peak'] / mb:>10.1f}")
+    print(f"Peak traced memory: {report['peak'] / mb:.1f} MB")
+    print("Top allocation sites:")
+    for site in report['top_sites']:
+        print(f"  {site['bytes'] / mb:8.1f} MB  {site['count']:>8} blocks  {site['site']}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Merge a main document and appendices into one PDF from a manifest."
+    )
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help="Log per-stage timings and sizes of each bundle")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    build_parser = subparsers.add_parser('build', help="Build one bundle from a manifest")
+    build_parser.add_argument('manifest', help="Path to the JSON/YAML manifest")
+    build_parser.add_argument('-o', '--output',
+                              help="Output PDF (default: the manifest's 'output', "
+                                   "or merged.pdf next to the manifest)")
+    build_parser.add_argument('--workers', type=int,
+                              help="Render worker processes "
+                                   "(default: APPENDIX_MERGER_WORKERS, or the CPU count)")
+    build_parser.add_argument('--profile-memory', action='store_true',
+                              help="Trace allocations (in one process) and print the peak, "
+                                   "per-stage deltas and top allocation sites")
+    
+    batch_parser = subparsers.add_parser(
+        'batch', help="Build every case folder (one manifest each) under a directory"
+    )
+    batch_parser.add_argument('cases_dir', help="Directory of case folders")
+    batch_parser.add_argument('--workers', type=int,
+                              help="Bundles built concurrently "
+                                   "(default: APPENDIX_MERGER_WORKERS, or the CPU count)")
+    batch_parser.add_argument('--report', help="Write a JSON report of all bundles here")
+    
+    args = parser.parse_args(argv)
+    if args.verbose:
+        logging.basicConfig(level=logging.INFO, format="%(message)s")
+    
+    if args.command == 'batch':
+        if not os.path.isdir(args.cases_dir):
+            print(f"Error: {args.cases_dir} is not a directory", file=sys.stderr)
+            return 1
+        
+        start = time.perf_counter()
+        results = run_batch(args.cases_dir, args.workers)
+        failed = [r for r in results if r['error']]
+        print(f"{len(results) - len(failed)}/{len(results)} bundles built, "
+              f"{len(failed)} failed, {time.perf_counter() - start:.2f}s total")
+        
+        if args.report:
+            with open(args.report, 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+        return 1 if failed else 0
+    
+    try:
+        if args.profile_memory:
+            with profile_memory() as report:
+                output_path, pages = build_bundle(args.manifest, args.output, workers=1)
+            print_memory_report(report)
+        else:
+            output_path, pages = build_bundle(args.manifest, args.output, args.workers)
+    except (OSError, ValueError, KeyError, PdfReadError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    
+    print(f"Wrote {output_path} ({pages} pages)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+# Regression test: deduplicate_objects leaves every page looking the same
+import io
+
+from PIL import Image
+from pypdf import PdfReader
+from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+
+import app
+
+# Back references to the page, and the obsolete /Name of fonts and forms,
+# which differs between otherwise identical copies
+IGNORED_KEYS = {'/Parent', '/P', '/Name'}
+
+
+def make_document(label: str) -> bytes:
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4)
+    for page in range(2):
+        c.drawString(72, 720, f"{label} page {page + 1}")
+        c.showPage()
+    c.save()
+    return buffer.getvalue()
+
+
+def make_photo() -> bytes:
+    buffer = io.BytesIO()
+    Image.radial_gradient('L').resize((400, 300)).convert('RGB').save(buffer, format='PNG')
+    return app.image_to_pdf(buffer.getvalue())
+
+
+def resolved(obj):
+    """An object with every reference followed, as a renderer reads it."""
+    if isinstance(obj, IndirectObject):
+        obj = obj.get_object()
+    if isinstance(obj, DictionaryObject):
+        items = {key: resolved(value) for key, value in obj.items() if key not in IGNORED_KEYS}
+        if isinstance(obj, StreamObject):
+            return items, obj.get_data()
+        return items
+    if isinstance(obj, ArrayObject):
+        return [resolved(item) for item in obj]
+    return obj
+
+
+def generate(dedup: bool) -> bytes:
+    """Generate a bundle with a repeated exhibit and photo, optionally without dedup."""
+    exhibit, photo = make_document('exhibit'), make_photo()
+    appendices = [
+        {'pdf': exhibit, 'pages': 2, 'title': 'הסכם'},
+        {'pdf': photo, 'pages': 1, 'title': 'תמונה'},
+        {'pdf': exhibit, 'pages': 2, 'title': 'הסכם - עותק'},
+        {'pdf': photo, 'pages': 1, 'title': 'תמונה - עותק'},
+    ]
+    settings = {'workers': 1}
+    
+    deduplicate_objects = app.deduplicate_objects
+    if not dedup:
+        app.deduplicate_objects = lambda writer: (0, 0)
+    try:
+        return app.two_pass_generate(make_document('main'), 2, appendices, settings).read()
+    finally:
+        app.deduplicate_objects = deduplicate_objects
+
+
+def test_dedup_keeps_pages_identical():
+    plain_bytes, deduplicated_bytes = generate(dedup=False), generate(dedup=True)
+    plain = PdfReader(io.BytesIO(plain_bytes))
+    deduplicated = PdfReader(io.BytesIO(deduplicated_bytes))
+    
+    assert len(deduplicated_bytes) < len(plain_bytes) / 2
+    assert len(plain.pages) == len(deduplicated.pages)
+    for page_num, (before, after) in enumerate(zip(plain.pages, deduplicated.pages), 1):
+        assert resolved(before) == resolved(after), f"page {page_num} changed"
+
+
+if __name__ == "__main__":
+    test_dedup_keeps_pages_identical()
+    print("Test completed - deduplicated pages are identical")
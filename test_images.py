@@ -0,0 +1,68 @@
+# Regression tests: image_to_pdf downsamples every image mode it accepts, and
+# only re-encodes JPEGs it downsampled
+import io
+
+from PIL import Image
+from pypdf import PdfReader
+
+from app import image_to_pdf
+
+# Wide enough to be downsampled at TARGET_DPI
+SIZE = (1800, 1200)
+TARGET_DPI = 72
+
+CASES = [
+    ("Bilevel TIFF (scanned exhibit)", '1', 'TIFF'),
+    ("Bilevel BMP", '1', 'BMP'),
+    ("16-bit grayscale TIFF", 'I;16', 'TIFF'),
+    ("Palette PNG", 'P', 'PNG'),
+    ("Grayscale PNG", 'L', 'PNG'),
+    ("RGB JPEG", 'RGB', 'JPEG'),
+    ("CMYK JPEG", 'CMYK', 'JPEG'),
+]
+
+
+# JPEGs that cannot be passed through but need no downsampling at full resolution
+LOSSLESS_CASES = [
+    ("Progressive JPEG", 'RGB', {'progressive': True}),
+    ("CMYK JPEG", 'CMYK', {}),
+]
+
+
+def make_image(mode: str, image_format: str, **save_options) -> bytes:
+    img = Image.linear_gradient('L').resize(SIZE)
+    if mode == 'I;16':
+        img = img.point(lambda v: v * 256, 'I').convert('I;16')
+    else:
+        img = img.convert(mode)
+    buffer = io.BytesIO()
+    img.save(buffer, format=image_format, **save_options)
+    return buffer.getvalue()
+
+
+def test_image_modes():
+    for name, mode, image_format in CASES:
+        pdf_bytes = image_to_pdf(make_image(mode, image_format), TARGET_DPI)
+        reader = PdfReader(io.BytesIO(pdf_bytes))
+        assert len(reader.pages) == 1, name
+        images = reader.pages[0].images
+        assert len(images) == 1, name
+        # Downsampled to the target resolution, not embedded full size
+        assert images[0].image.width < SIZE[0], name
+
+
+
+def test_jpegs_not_downsampled_stay_lossless():
+    for name, mode, save_options in LOSSLESS_CASES:
+        pdf_bytes = image_to_pdf(make_image(mode, 'JPEG', **save_options), None)
+        xobjects = PdfReader(io.BytesIO(pdf_bytes)).pages[0]['/Resources']['/XObject']
+        filters = [xobject.get_object().get('/Filter') for xobject in xobjects.values()]
+        assert len(filters) == 1, name
+        # Flattened and embedded losslessly, not re-encoded as a lossy JPEG
+        assert '/DCTDecode' not in str(filters[0]), name
+
+
+if __name__ == "__main__":
+    test_image_modes()
+    test_jpegs_not_downsampled_stay_lossless()
+    print("Test completed - all image modes converted")
@@ -0,0 +1,74 @@
+# Regression test: documents whose page tree misstates its size still give a
+# correct bundle, instead of failing or pointing the TOC at the wrong pages
+import io
+
+from pypdf import PdfReader, PdfWriter
+from pypdf.generic import ArrayObject, DictionaryObject, NameObject, NumberObject
+from reportlab.pdfgen import canvas
+
+from app import count_pdf_pages, two_pass_generate
+
+PAGES = 3
+CLAIMED = 5
+
+
+def make_pdf(pages: int, label: str) -> bytes:
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer)
+    for i in range(pages):
+        c.drawString(100, 400, f"{label} page {i + 1}")
+        c.showPage()
+    c.save()
+    return buffer.getvalue()
+
+
+def misstate_count(pdf_bytes: bytes, nested: bool) -> bytes:
+    """Claim CLAIMED pages at the root, and with nested also in an inner node."""
+    writer = PdfWriter(clone_from=io.BytesIO(pdf_bytes))
+    root = writer.root_object['/Pages']
+    if nested:
+        inner = DictionaryObject({
+            NameObject('/Type'): NameObject('/Pages'),
+            NameObject('/Kids'): ArrayObject(root['/Kids']),
+            NameObject('/Count'): NumberObject(CLAIMED),
+            NameObject('/Parent'): root.indirect_reference,
+        })
+        inner_ref = writer._add_object(inner)
+        for kid in inner['/Kids']:
+            kid.get_object()[NameObject('/Parent')] = inner_ref
+        root[NameObject('/Kids')] = ArrayObject([inner_ref])
+    root[NameObject('/Count')] = NumberObject(CLAIMED)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+def test_root_count_checked_against_kids():
+    assert count_pdf_pages(misstate_count(make_pdf(PAGES, 'flat'), nested=False)) == PAGES
+
+
+def test_bundle_replanned_with_actual_counts():
+    # The nested tree agrees with itself, so only assembly finds the real count
+    main = misstate_count(make_pdf(PAGES, 'main'), nested=True)
+    appendices = [
+        {'pdf': misstate_count(make_pdf(PAGES, 'first'), nested=True),
+         'pages': CLAIMED, 'title': 'First'},
+        {'pdf': make_pdf(2, 'second'), 'pages': 2, 'title': 'Second'},
+    ]
+    cache = {}
+    bundle = two_pass_generate(main, CLAIMED, appendices, {'workers': 1}, cache).read()
+    reader = PdfReader(io.BytesIO(bundle))
+    # Main, TOC, cover + first, cover + second
+    assert len(reader.pages) == PAGES + 1 + 1 + PAGES + 1 + 2
+    
+    # The covers were rendered with the ranges the appendices actually land
+    # on; the cover cache is keyed by (number, title, start, end, ...)
+    second_cover = PAGES + 1 + 1 + PAGES + 1
+    ranges = sorted(key[2:4] for key in cache['covers'])
+    assert ranges == [(PAGES + 2, PAGES + 2 + PAGES), (second_cover, second_cover + 2)]
+
+
+if __name__ == "__main__":
+    test_root_count_checked_against_kids()
+    test_bundle_replanned_with_actual_counts()
+    print("Test completed - misstated page counts handled")